@@ -1,58 +1,59 @@
-import asyncio
+import hashlib
+import hmac
+import logging
 import os
-import threading
 
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, Response, jsonify, request
 from telegram import Update
 
-import db
-from bot import DB_PATH, build_app
-from worker import run_tick_once
+from bot_runtime import ensure_tg_app, process_update, run_sync
+from worker import TICK_CONCURRENCY, TICK_CONCURRENCY_MAX, run_tick_once
+
+# Telegram updates are far below this; anything bigger is not worth parsing.
+_MAX_UPDATE_BYTES = 1_000_000
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = _MAX_UPDATE_BYTES
+LOGGER = logging.getLogger(__name__)
+
+_OK_BODY = orjson.dumps({"ok": True})
+
 
-_LOCK = threading.Lock()
-_LOOP = asyncio.new_event_loop()
-_TG_APP = None
+def _digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode("utf-8")).digest()
 
 
-def _run(coro):
-    with _LOCK:
-        return _LOOP.run_until_complete(coro)
+def _secret_digest(env_name: str) -> bytes | None:
+    secret = os.getenv(env_name, "").strip()
+    return _digest(secret) if secret else None
 
 
-def _ensure_tg_app():
-    global _TG_APP
-    if _TG_APP is not None:
-        return _TG_APP
+# Secrets are fixed for the lifetime of a deployment; hash them once.
+_TG_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+_TG_SECRET_DIGEST = _secret_digest("TELEGRAM_WEBHOOK_SECRET")
+_CRON_SECRET_HEADER = "X-Cron-Secret"
+_CRON_SECRET_DIGEST = _secret_digest("CRON_SECRET")
 
-    token = os.getenv("BOT_TOKEN")
-    if not token:
-        raise RuntimeError("BOT_TOKEN is required")
 
-    with _LOCK:
-        if _TG_APP is None:
-            db.init_db(DB_PATH)
-            _TG_APP = build_app(token)
-            _LOOP.run_until_complete(_TG_APP.initialize())
-    return _TG_APP
+def _secret_matches(got: str, required_digest: bytes) -> bool:
+    # Compare fixed-size digests so neither content nor length leaks via timing.
+    return hmac.compare_digest(_digest(got), required_digest)
 
 
 def _check_telegram_secret() -> bool:
-    required = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip()
-    if not required:
+    if _TG_SECRET_DIGEST is None:
         return True
-    got = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
-    return got == required
+    got = request.headers.get(_TG_SECRET_HEADER, "")
+    return _secret_matches(got, _TG_SECRET_DIGEST)
 
 
 def _check_cron_secret() -> bool:
-    required = os.getenv("CRON_SECRET", "").strip()
-    if not required:
+    if _CRON_SECRET_DIGEST is None:
         return True
-    got_qs = request.args.get("token", "")
-    got_header = request.headers.get("X-Cron-Secret", "")
-    return got_qs == required or got_header == required
+    # The query string is only parsed when the header is absent.
+    got = request.headers.get(_CRON_SECRET_HEADER) or request.args.get("token", "")
+    return _secret_matches(got, _CRON_SECRET_DIGEST)
 
 
 @app.get("/")
@@ -64,16 +65,21 @@ def health():
 def telegram_webhook():
     if not _check_telegram_secret():
         return jsonify({"ok": False, "error": "forbidden"}), 403
+    if (request.content_length or 0) > _MAX_UPDATE_BYTES:
+        return jsonify({"ok": False, "error": "too large"}), 413
 
     try:
-        payload = request.get_json(silent=True)
+        try:
+            payload = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            payload = None
         if not isinstance(payload, dict):
             return jsonify({"ok": False, "error": "bad json"}), 400
 
-        tg_app = _ensure_tg_app()
+        tg_app = ensure_tg_app()
         update = Update.de_json(payload, tg_app.bot)
-        _run(tg_app.process_update(update))
-        return jsonify({"ok": True})
+        process_update(tg_app, update)
+        return Response(_OK_BODY, mimetype="application/json")
     except Exception as e:
         return (
             jsonify(
@@ -93,7 +99,10 @@ def cron_tick():
         return jsonify({"ok": False, "error": "forbidden"}), 403
 
     try:
-        result = asyncio.run(run_tick_once())
+        # Query-string override, clamped so a request cannot fan out without limit.
+        concurrency = min(max(request.args.get("c", TICK_CONCURRENCY, type=int), 1), TICK_CONCURRENCY_MAX)
+        tg_app = ensure_tg_app()
+        result = run_sync(run_tick_once(bot=tg_app.bot, concurrency=concurrency))
         return jsonify({"ok": True, **result})
     except Exception as e:
         return (
@@ -108,3 +117,12 @@ def cron_tick():
             ),
             500,
         )
+
+
+# Pay for DB setup and Application.initialize() at cold start rather than
+# on the first Telegram request.
+if os.getenv("BOT_TOKEN"):
+    try:
+        ensure_tg_app()
+    except Exception:
+        LOGGER.exception("telegram app warm-up failed")
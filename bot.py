@@ -1,11 +1,14 @@
-import html
-import json
+import asyncio
+import functools
 import logging
 import os
 import re
+import sys
+from dataclasses import dataclass, field, fields
 from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
+import orjson
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -15,6 +18,7 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
@@ -24,6 +28,7 @@ from telegram.ext import (
 )
 
 import db
+from messages import COPY, PRESENCE, QUOTE_FALLBACK, QUOTE_MESSAGES, QUOTE_PREFIX, morning_base_text
 from ptb_persistence import DbPersistence
 
 logging.basicConfig(level=logging.INFO)
@@ -33,13 +38,31 @@ START_DATE = date(2026, 2, 18)
 END_DATE = date(2026, 4, 4)
 DB_PATH = os.getenv("DB_PATH") or os.getenv("DATABASE_URL", "bot.sqlite3")
 RESTART_ONBOARDING_COMMAND = "/restart_onboarding"
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+# The only update kinds any handler reacts to.
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
-with open("texts/copy.ru.json", "r", encoding="utf-8") as f:
-    COPY = json.load(f)
-with open("texts/quotes.json", "r", encoding="utf-8") as f:
-    QUOTES = json.load(f)
-with open("texts/presence_lines.json", "r", encoding="utf-8") as f:
-    PRESENCE = json.load(f)
+BUTTONS = COPY["buttons"]
+ONB = COPY["onboarding"]
+ERR = COPY["errors"]
+MORNING = COPY["morning"]
+EVENING = COPY["evening"]
+FINAL = COPY["final"]
+COMMON = COPY["common"]
+
+
+def _single_field_template(template: str, field: str):
+    # Templates with exactly one placeholder are pre-split so filling them is a
+    # concatenation; anything else keeps going through str.format.
+    parts = template.split("{" + field + "}")
+    if len(parts) == 2 and not any(c in part for part in parts for c in "{}"):
+        prefix, suffix = parts
+        return lambda value: f"{prefix}{value}{suffix}"
+    return lambda value: template.format(**{field: value})
+
+
+reflection_confirm_text = _single_field_template(ONB["reflection_confirm"], "reflection_text")
+timezone_confirm_text = _single_field_template(ONB["timezone_confirm"], "timezone_label")
 
 (
     ONB_START_GATE,
@@ -56,14 +79,19 @@ with open("texts/presence_lines.json", "r", encoding="utf-8") as f:
     TEST_RUN,
 ) = range(12)
 
-TIME_RE = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$")
+_WS_RE = re.compile(r"\s+")
 OTHER_TIMEZONE_OPTIONS = COPY["timezone_other_options"]
+# Reversed so the first entry wins, main list before the "other" list.
+_TZ_LABELS = {
+    item.get("tz"): item.get("label") for item in reversed(COPY["timezone_options"] + OTHER_TIMEZONE_OPTIONS)
+}
 
 
-def admin_ids() -> set[int]:
+@functools.lru_cache(maxsize=1)
+def admin_ids() -> frozenset[int]:
     raw = os.getenv("ADMIN_USER_ID", "").strip()
     if not raw:
-        return set()
+        return frozenset()
     out: set[int] = set()
     for part in raw.split(","):
         part = part.strip()
@@ -73,67 +101,87 @@ def admin_ids() -> set[int]:
             out.add(int(part))
         except ValueError:
             continue
-    return out
+    return frozenset(out)
 
 
 def is_admin(user_id: int) -> bool:
     return user_id in admin_ids()
 
 
+def get_user_cached(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> dict | None:
+    # Kept on the CallbackContext, which PTB builds once per update. user_data
+    # would be persisted and would serve stale rows to later updates.
+    rows = vars(context).setdefault("_user_rows", {})
+    if user_id not in rows:
+        rows[user_id] = db.get_user(DB_PATH, user_id)
+    return rows[user_id]
+
+
+def remember_cached_user(context: ContextTypes.DEFAULT_TYPE, user_id: int, user: dict | None) -> None:
+    vars(context).setdefault("_user_rows", {})[user_id] = user
+
+
+def forget_cached_user(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    vars(context).get("_user_rows", {}).pop(user_id, None)
+
+
 def _onb_draft_key(user_id: int) -> str:
     return f"onboarding_draft:{user_id}"
 
 
-def get_onb_draft(user_id: int) -> dict:
-    raw = db.get_runtime_state(DB_PATH, _onb_draft_key(user_id))
+def _parse_onb_draft(raw: str | None) -> dict:
     if not raw:
         return {}
     try:
-        data = json.loads(raw)
-        return data if isinstance(data, dict) else {}
+        data = orjson.loads(raw)
     except Exception:
         return {}
+    if not isinstance(data, dict):
+        return {}
+    # Drafts share a handful of keys; interning lets all loaded drafts reuse them.
+    return {sys.intern(k): v for k, v in data.items()}
+
+
+def get_onb_draft(user_id: int) -> dict:
+    return _parse_onb_draft(db.get_runtime_state(DB_PATH, _onb_draft_key(user_id)))
 
 
 def set_onb_draft(user_id: int, **fields) -> None:
     draft = get_onb_draft(user_id)
     draft.update(fields)
-    db.set_runtime_state(DB_PATH, _onb_draft_key(user_id), json.dumps(draft, ensure_ascii=False))
+    db.set_runtime_state(DB_PATH, _onb_draft_key(user_id), orjson.dumps(draft).decode())
 
 
 def clear_onb_draft(user_id: int) -> None:
-    db.set_runtime_state(DB_PATH, _onb_draft_key(user_id), "{}")
-
+    # A missing row reads back as an empty draft, and deleting a missing row
+    # changes nothing, so users without a draft cost no write.
+    db.delete_runtime_state(DB_PATH, _onb_draft_key(user_id))
 
-def get_onboarding_state_for_user(user_id: int) -> int | None:
-    raw = db.get_runtime_state(DB_PATH, "conv:onboarding_conv")
-    if not raw:
-        return None
-    try:
-        rows = json.loads(raw)
-    except Exception:
-        return None
-    if not isinstance(rows, list):
-        return None
 
-    for row in rows:
-        if not isinstance(row, dict):
+def _load_all_onboarding_states() -> dict[int, int | None]:
+    states: dict[int, int | None] = {}
+    for raw_key, raw_state in db.get_ptb_conversations(DB_PATH, "onboarding_conv").items():
+        try:
+            key = orjson.loads(raw_key)
+        except Exception:
             continue
-        key = row.get("key")
         if not isinstance(key, list):
             continue
         try:
             key_ints = [int(x) for x in key]
         except Exception:
             continue
-        if user_id not in key_ints:
-            continue
-        state = row.get("state")
         try:
-            return int(state)
+            state = int(orjson.loads(raw_state))
         except Exception:
-            return None
-    return None
+            state = None
+        for key_int in key_ints:
+            states.setdefault(key_int, state)
+    return states
+
+
+def get_onboarding_state_for_user(user_id: int) -> int | None:
+    return _load_all_onboarding_states().get(user_id)
 
 
 def resolve_timezone_label_from_draft(draft: dict) -> str | None:
@@ -143,130 +191,224 @@ def resolve_timezone_label_from_draft(draft: dict) -> str | None:
     tz = draft.get("timezone")
     if not tz:
         return None
-    for item in COPY["timezone_options"]:
-        if item.get("tz") == tz:
-            return item.get("label")
-    for item in OTHER_TIMEZONE_OPTIONS:
-        if item.get("tz") == tz:
-            return item.get("label")
+    if tz in _TZ_LABELS:
+        return _TZ_LABELS[tz]
     return str(tz)
 
 
-def build_menu_rows(paused: bool) -> list[list[str]]:
+def _menu_rows(paused: bool) -> list[list[str]]:
     pause_key = "resume" if paused else "pause"
-    return [[COPY["buttons"]["time_change"]], [COPY["buttons"][pause_key]]]
+    return [[BUTTONS["time_change"]], [BUTTONS[pause_key]]]
 
 
-def menu_markup_for_user(user: dict | None) -> ReplyKeyboardMarkup:
-    paused = bool(user and int(user.get("paused", 0)) == 1)
-    return ReplyKeyboardMarkup(build_menu_rows(paused), resize_keyboard=True, one_time_keyboard=False)
+# Indexed by the paused flag; there are only two possible menus.
+_MENU_ROWS = (_menu_rows(False), _menu_rows(True))
+
+
+def build_menu_rows(paused: bool) -> list[list[str]]:
+    return _MENU_ROWS[paused]
+
+
+def _is_paused(user: dict | None) -> bool:
+    return bool(user and int(user.get("paused", 0)) == 1)
+
+
+def _tz_option_markup(options: list[dict], prefix: str, back: str | None = None) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(item["label"], callback_data=f"{prefix}{idx}")] for idx, item in enumerate(options)]
+    if back:
+        rows.append([InlineKeyboardButton(BUTTONS["back"], callback_data=back)])
+    return InlineKeyboardMarkup(rows)
+
+
+def _confirm_markup(prefix: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton(BUTTONS["save"], callback_data=f"{prefix}:tz_save")],
+            [InlineKeyboardButton(BUTTONS["edit"], callback_data=f"{prefix}:tz_edit")],
+        ]
+    )
+
+
+# Markups are immutable and depend only on COPY, so build each one once.
+_MENU_MARKUPS = tuple(
+    ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=False) for rows in _MENU_ROWS
+)
+_EVENING_CHOICE_MARKUPS = tuple(
+    ReplyKeyboardMarkup(
+        [[BUTTONS["status_full"]], [BUTTONS["status_partial"]], [BUTTONS["status_none"]]] + rows,
+        resize_keyboard=True,
+        one_time_keyboard=False,
+    )
+    for rows in _MENU_ROWS
+)
+_POST_ANSWER_MARKUPS = tuple(
+    ReplyKeyboardMarkup([[BUTTONS["edit_answer"]]] + rows, resize_keyboard=True, one_time_keyboard=False)
+    for rows in _MENU_ROWS
+)
+_START_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton(BUTTONS["start"], callback_data="onb:start")]])
+_TZ_MARKUP = _tz_option_markup(COPY["timezone_options"], "tz:")
+_TEST_TZ_MARKUP = _tz_option_markup(COPY["timezone_options"], "test:tz:")
+_OTHER_TZ_MARKUP = _tz_option_markup(OTHER_TIMEZONE_OPTIONS, "tzother:pick:", back="tzother:back")
+_TEST_OTHER_TZ_MARKUP = _tz_option_markup(OTHER_TIMEZONE_OPTIONS, "test:tzother:pick:", back="test:tzother:back")
+_TZ_CONFIRM_MARKUPS = {"onb": _confirm_markup("onb"), "test": _confirm_markup("test")}
+_REFLECTION_PROMPT_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton(BUTTONS["skip"], callback_data="onb:skip")],
+    ]
+)
+_REFLECTION_CONFIRM_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton(BUTTONS["save"], callback_data="onb:save")],
+        [InlineKeyboardButton(BUTTONS["edit"], callback_data="onb:edit")],
+        [InlineKeyboardButton(BUTTONS["back"], callback_data="onb:back_to_prompt")],
+    ]
+)
+_TEST_REFLECTION_CONFIRM_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton(BUTTONS["save"], callback_data="test:reflection:save")],
+        [InlineKeyboardButton(BUTTONS["edit"], callback_data="test:reflection:edit")],
+    ]
+)
+_TEST_PICK_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton(BUTTONS["scenario_before"], callback_data="test:before")],
+        [InlineKeyboardButton(BUTTONS["scenario_during"], callback_data="test:during")],
+        [InlineKeyboardButton(BUTTONS["scenario_april"], callback_data="test:april")],
+        [InlineKeyboardButton(BUTTONS["scenario_after"], callback_data="test:after")],
+    ]
+)
+_TEST_NEXT_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton(BUTTONS["next"], callback_data="test:next")]])
+_TEST_FINAL_THANKS_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(BUTTONS["thanks"], callback_data="test:final:thanks")]]
+)
 
 
-def menu_markup_for_user_id(user_id: int) -> ReplyKeyboardMarkup:
-    user = db.get_user(DB_PATH, user_id)
-    return menu_markup_for_user(user)
+def menu_markup_for_user(user: dict | None) -> ReplyKeyboardMarkup:
+    return _MENU_MARKUPS[_is_paused(user)]
 
 
 def choice_markup(rows: list[list[str]]) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
 
 
+_CHANGE_TARGET_MARKUP = choice_markup([[BUTTONS["change_morning"]], [BUTTONS["change_evening"]], [BUTTONS["back"]]])
+_TEST_EVENING_PROMPT_MARKUP = choice_markup(
+    [
+        [BUTTONS["status_full"]],
+        [BUTTONS["status_partial"]],
+        [BUTTONS["status_none"]],
+        [BUTTONS["next"]],
+        [BUTTONS["skip_to_final"]],
+    ]
+)
+_TEST_DAY_NEXT_MARKUP = choice_markup([[BUTTONS["edit_answer"]], [BUTTONS["next"]], [BUTTONS["skip_to_final"]]])
+_TEST_REMINDER_NEXT_MARKUP = choice_markup([[BUTTONS["next"]], [BUTTONS["skip_to_final"]]])
+
+
 def timezone_markup() -> InlineKeyboardMarkup:
-    rows = []
-    for idx, item in enumerate(COPY["timezone_options"]):
-        rows.append([InlineKeyboardButton(item["label"], callback_data=f"tz:{idx}")])
-    return InlineKeyboardMarkup(rows)
+    return _TZ_MARKUP
 
 
 def other_timezone_markup() -> InlineKeyboardMarkup:
-    rows: list[list[InlineKeyboardButton]] = []
-    for idx, item in enumerate(OTHER_TIMEZONE_OPTIONS):
-        rows.append([InlineKeyboardButton(item["label"], callback_data=f"tzother:pick:{idx}")])
-    rows.append([InlineKeyboardButton(COPY["buttons"]["back"], callback_data="tzother:back")])
-    return InlineKeyboardMarkup(rows)
+    return _OTHER_TZ_MARKUP
 
 
 def test_other_timezone_markup() -> InlineKeyboardMarkup:
-    rows: list[list[InlineKeyboardButton]] = []
-    for idx, item in enumerate(OTHER_TIMEZONE_OPTIONS):
-        rows.append([InlineKeyboardButton(item["label"], callback_data=f"test:tzother:pick:{idx}")])
-    rows.append([InlineKeyboardButton(COPY["buttons"]["back"], callback_data="test:tzother:back")])
-    return InlineKeyboardMarkup(rows)
+    return _TEST_OTHER_TZ_MARKUP
 
 
 def reflection_prompt_markup() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton(COPY["buttons"]["skip"], callback_data="onb:skip")],
-        ]
-    )
+    return _REFLECTION_PROMPT_MARKUP
 
 
 def reflection_confirm_markup() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton(COPY["buttons"]["save"], callback_data="onb:save")],
-            [InlineKeyboardButton(COPY["buttons"]["edit"], callback_data="onb:edit")],
-            [InlineKeyboardButton(COPY["buttons"]["back"], callback_data="onb:back_to_prompt")],
-        ]
-    )
+    return _REFLECTION_CONFIRM_MARKUP
 
 
 def timezone_confirm_markup(prefix: str = "onb") -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton(COPY["buttons"]["save"], callback_data=f"{prefix}:tz_save")],
-            [InlineKeyboardButton(COPY["buttons"]["edit"], callback_data=f"{prefix}:tz_edit")],
-        ]
-    )
+    return _TZ_CONFIRM_MARKUPS.get(prefix) or _confirm_markup(prefix)
 
 
 def evening_choice_markup(user: dict) -> ReplyKeyboardMarkup:
-    rows = [
-        [COPY["buttons"]["status_full"]],
-        [COPY["buttons"]["status_partial"]],
-        [COPY["buttons"]["status_none"]],
-    ] + build_menu_rows(bool(int(user.get("paused", 0)) == 1))
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=False)
+    return _EVENING_CHOICE_MARKUPS[_is_paused(user)]
 
 
 def post_answer_markup(user: dict) -> ReplyKeyboardMarkup:
-    rows = [[COPY["buttons"]["edit_answer"]]] + build_menu_rows(bool(int(user.get("paused", 0)) == 1))
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=False)
+    return _POST_ANSWER_MARKUPS[_is_paused(user)]
+
+
+@functools.lru_cache(maxsize=64)
+def _zi(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
 
 
 def local_today_for_user(user: dict) -> date:
-    tz = ZoneInfo(user["timezone"]) if user and user.get("timezone") else timezone.utc
+    tz = _zi(user["timezone"]) if user and user.get("timezone") else timezone.utc
     return datetime.now(timezone.utc).astimezone(tz).date()
 
 
+def _valid_hhmm(value: str) -> bool:
+    # Fixed five-character "HH:MM", 00:00-23:59; plain comparisons beat a regex here.
+    if len(value) != 5 or value[2] != ":":
+        return False
+    h1, h2, _, m1, m2 = value
+    if not ("0" <= h1 <= "2" and "0" <= h2 <= "9" and "0" <= m1 <= "5" and "0" <= m2 <= "9"):
+        return False
+    return h1 != "2" or h2 <= "3"
+
+
 def parse_hhmm(value: str) -> tuple[int, int]:
-    h, m = value.split(":", 1)
-    return int(h), int(m)
+    # Stored times are always validated "HH:MM".
+    return int(value[:2]), int(value[3:])
 
 
 def normalize_button_text(text: str | None) -> str:
     if text is None:
         return ""
-    return re.sub(r"\s+", " ", text.replace("\ufe0f", "").strip())
+    return _WS_RE.sub(" ", text.replace("\ufe0f", "").strip())
+
+
+# Normalized forms of the reply-keyboard buttons, computed once.
+_BTN_TIME = normalize_button_text(BUTTONS["time_change"])
+_BTN_PAUSE = normalize_button_text(BUTTONS["pause"])
+_BTN_RESUME = normalize_button_text(BUTTONS["resume"])
+_MENU_ACTIVE = frozenset({_BTN_TIME, _BTN_PAUSE})
+_MENU_PAUSED = frozenset({_BTN_TIME, _BTN_RESUME})
+_STATUS_MAP = {
+    normalize_button_text(BUTTONS["status_full"]): "full",
+    normalize_button_text(BUTTONS["status_partial"]): "partial",
+    normalize_button_text(BUTTONS["status_none"]): "none",
+}
 
 
 def local_time_is_due(local_now: datetime, hhmm: str) -> bool:
     h, m = parse_hhmm(hhmm)
-    return local_now.time().replace(second=0, microsecond=0) >= datetime(
-        local_now.year, local_now.month, local_now.day, h, m
-    ).time()
+    return local_now.hour * 60 + local_now.minute >= h * 60 + m
 
 
 def parse_status_from_text(text: str) -> str | None:
-    normalized = normalize_button_text(text)
-    if normalized == normalize_button_text(COPY["buttons"]["status_full"]):
-        return "full"
-    if normalized == normalize_button_text(COPY["buttons"]["status_partial"]):
-        return "partial"
-    if normalized == normalize_button_text(COPY["buttons"]["status_none"]):
-        return "none"
-    return None
+    return _STATUS_MAP.get(normalize_button_text(text))
+
+
+# Exact reply-keyboard texts the evening and test handlers branch on. Status
+# buttons map to their status so one lookup covers the common case.
+_BUTTON_ACTIONS = {
+    BUTTONS["edit_answer"]: "edit",
+    BUTTONS["next"]: "next",
+    BUTTONS["skip_to_final"]: "skip",
+    BUTTONS["status_full"]: "full",
+    BUTTONS["status_partial"]: "partial",
+    BUTTONS["status_none"]: "none",
+}
+_STATUS_ACTIONS = frozenset({"full", "partial", "none"})
+
+
+def button_action(text: str) -> str | None:
+    action = _BUTTON_ACTIONS.get(text)
+    if action is None:
+        # Clients may alter emoji presentation/spacing on status buttons.
+        return parse_status_from_text(text)
+    return action
 
 
 async def send_onboarding_catchup_messages(update: Update, user: dict, local_now: datetime) -> None:
@@ -283,78 +425,77 @@ async def send_onboarding_catchup_messages(update: Update, user: dict, local_now
 
     day_row = db.ensure_day_row(DB_PATH, user_id, local_date, start_date)
     day_number = int(day_row["day_number"])
+    sent = db.get_sent_messages(DB_PATH, user_id, local_date)
+    morning_due = local_time_is_due(local_now, user["morning_time"])
 
-    if local_time_is_due(local_now, user["morning_time"]) and not db.has_sent_message(
-        DB_PATH, user_id, local_date, "morning_status"
-    ):
+    # Collect everything that is due first so the sends go out back to back,
+    # in chat order, and the markers are claimed in one statement.
+    outgoing: list[tuple[str, str, dict]] = []
+    if morning_due and "morning_status" not in sent:
         if local_date == END_DATE:
-            status_text = COPY["morning"]["last_day"]
+            status_text = MORNING["last_day"]
         else:
             days_left = max((END_DATE - local_date).days, 0)
-            status_text = COPY["morning"]["base"].format(day_number=day_number, days_left=days_left)
+            status_text = morning_base_text(day_number, days_left)
             y_row = db.get_day(DB_PATH, user_id, local_date - timedelta(days=1))
             if y_row and y_row.get("status") is None:
-                status_text = f"{COPY['morning']['yesterday_missed']}\n\n{status_text}"
+                status_text = f"{MORNING['yesterday_missed']}\n\n{status_text}"
             if local_date >= date(2026, 3, 13):
-                status_text = f"{status_text}\n\n{COPY['morning']['halfway']}"
+                status_text = f"{status_text}\n\n{MORNING['halfway']}"
+        outgoing.append(("morning_status", status_text, {"reply_markup": menu_markup_for_user(user)}))
 
-        await update.message.reply_text(status_text, reply_markup=menu_markup_for_user(user))
-        db.record_sent_message(DB_PATH, user_id, local_date, "morning_status")
-
-    if (
-        local_date != END_DATE
-        and local_time_is_due(local_now, user["morning_time"])
-        and not db.has_sent_message(DB_PATH, user_id, local_date, "morning_quote")
-    ):
+    if local_date != END_DATE and morning_due and "morning_quote" not in sent:
         idx = day_number - 1
-        quote = QUOTES[idx] if 0 <= idx < len(QUOTES) else "—"
-        quote_text = COPY["morning"]["quote_message"].format(quote=f"<i>{html.escape(quote)}</i>")
-        await update.message.reply_text(
-            quote_text,
-            parse_mode="HTML",
-            reply_markup=menu_markup_for_user(user),
+        quote_text, quote_entities = QUOTE_MESSAGES[idx] if 0 <= idx < len(QUOTE_MESSAGES) else QUOTE_FALLBACK
+        outgoing.append(
+            ("morning_quote", quote_text, {"entities": quote_entities, "reply_markup": menu_markup_for_user(user)})
         )
-        db.record_sent_message(DB_PATH, user_id, local_date, "morning_quote")
 
-    if local_time_is_due(local_now, user["evening_time"]) and not db.has_sent_message(
-        DB_PATH, user_id, local_date, "evening_prompt"
-    ):
-        await update.message.reply_text(
-            COPY["evening"]["prompt"],
-            reply_markup=evening_choice_markup(user),
-        )
-        db.record_sent_message(DB_PATH, user_id, local_date, "evening_prompt")
+    if local_time_is_due(local_now, user["evening_time"]) and "evening_prompt" not in sent:
+        outgoing.append(("evening_prompt", EVENING["prompt"], {"reply_markup": evening_choice_markup(user)}))
+
+    # A worker tick running now cannot send the claimed ones too; whatever
+    # did not go out is released for the worker to retry.
+    claimed = db.claim_sent_messages(DB_PATH, user_id, local_date, [message_type for message_type, _, _ in outgoing])
+    pending = [message_type for message_type, _, _ in outgoing if message_type in claimed]
+    try:
+        for message_type, text, kwargs in outgoing:
+            if message_type in claimed:
+                await update.message.reply_text(text, **kwargs)
+                pending.remove(message_type)
+    finally:
+        db.release_sent_messages(DB_PATH, user_id, local_date, pending)
 
 
-def build_test_steps(scenario: str) -> list[str]:
+def _build_test_steps(scenario: str) -> tuple[str, ...]:
     if scenario == "after":
-        return [COPY["common"]["already_finished"]]
+        return (COMMON["already_finished"],)
 
     if scenario == "before":
-        finish_steps = [COPY["onboarding"]["finish_before_start"]]
+        finish_steps = [ONB["finish_before_start"]]
     elif scenario == "during":
-        finish_steps = [COPY["onboarding"]["finish_base"], COPY["onboarding"]["finish_during"]]
+        finish_steps = [ONB["finish_base"], ONB["finish_during"]]
     else:
         finish_steps = [
-            COPY["onboarding"]["finish_base"],
-            COPY["onboarding"]["finish_april"],
+            ONB["finish_base"],
+            ONB["finish_april"],
         ]
 
     steps = [
-        COPY["onboarding"]["screen_1"],
-        COPY["onboarding"]["screen_2"],
-        COPY["onboarding"]["screen_3"],
-        COPY["onboarding"]["screen_4"],
-        COPY["onboarding"]["screen_5"],
-        COPY["onboarding"]["screen_6"],
-        COPY["onboarding"]["screen_7"],
+        ONB["screen_1"],
+        ONB["screen_2"],
+        ONB["screen_3"],
+        ONB["screen_4"],
+        ONB["screen_5"],
+        ONB["screen_6"],
+        ONB["screen_7"],
     ]
     steps.extend(finish_steps)
     steps.append("__TEST_DAY_LOOP__")
-    return steps
+    return tuple(steps)
 
 
-def test_day_params(scenario: str) -> tuple[int, int]:
+def _test_day_params(scenario: str) -> tuple[int, int]:
     if scenario == "before":
         return 46, 46
     if scenario == "during":
@@ -364,67 +505,73 @@ def test_day_params(scenario: str) -> tuple[int, int]:
     return 46, 46
 
 
+# Scenarios are a fixed set, so the tables are built once and shared by every
+# test session; only the scenario name and index live in user state.
+_TEST_SCENARIOS = ("before", "during", "april", "after")
+_TEST_STEPS = {scenario: _build_test_steps(scenario) for scenario in _TEST_SCENARIOS}
+_TEST_LAST_INDEX = {scenario: len(steps) - 1 for scenario, steps in _TEST_STEPS.items()}
+_TEST_DAY_PARAMS = {scenario: _test_day_params(scenario) for scenario in _TEST_SCENARIOS}
+
+
+def build_test_steps(scenario: str) -> tuple[str, ...]:
+    steps = _TEST_STEPS.get(scenario)
+    return steps if steps is not None else _build_test_steps(scenario)
+
+
+def test_day_params(scenario: str) -> tuple[int, int]:
+    params = _TEST_DAY_PARAMS.get(scenario)
+    return params if params is not None else _test_day_params(scenario)
+
+
+_MENU_FALLBACK_SUBSTRINGS = ("изменить время", "пауза", "возобнов")
+
+
 def is_menu_button_text(text: str, user: dict) -> bool:
     normalized = normalize_button_text(text)
-    lowered = normalized.lower()
-    # Defensive fallback: Telegram clients may alter emoji presentation/spacing.
-    if "изменить время" in lowered or "пауза" in lowered or "возобнов" in lowered:
+    menu = _MENU_PAUSED if int(user.get("paused", 0)) == 1 else _MENU_ACTIVE
+    if normalized in menu:
         return True
 
-    allowed = {
-        normalize_button_text(COPY["buttons"]["time_change"]),
-        normalize_button_text(COPY["buttons"]["pause"]),
-        normalize_button_text(COPY["buttons"]["resume"]),
-    }
-    if int(user.get("paused", 0)) == 1:
-        return normalized in {
-            normalize_button_text(COPY["buttons"]["time_change"]),
-            normalize_button_text(COPY["buttons"]["resume"]),
-        }
-    return normalized in {
-        normalize_button_text(COPY["buttons"]["time_change"]),
-        normalize_button_text(COPY["buttons"]["pause"]),
-    }
+    # Defensive fallback: Telegram clients may alter emoji presentation/spacing.
+    lowered = normalized.lower()
+    return any(part in lowered for part in _MENU_FALLBACK_SUBSTRINGS)
 
 
 async def send_onboarding_start(message, user_id: int) -> int:
-    kb = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(COPY["buttons"]["start"], callback_data="onb:start")]]
-    )
-    await message.reply_text(COPY["onboarding"]["screen_1"], reply_markup=kb)
+    await message.reply_text(ONB["screen_1"], reply_markup=_START_MARKUP)
     return ONB_START_GATE
 
 
 async def send_reflection_prompt(message) -> int:
-    await message.reply_text(COPY["onboarding"]["screen_3"], reply_markup=reflection_prompt_markup())
+    await message.reply_text(ONB["screen_3"], reply_markup=reflection_prompt_markup())
     return ONB_REFLECTION_INPUT
 
 
 async def send_timezone_step(message) -> int:
-    await message.reply_text(COPY["onboarding"]["screen_4"], reply_markup=timezone_markup())
+    await message.reply_text(ONB["screen_4"], reply_markup=timezone_markup())
     return ONB_TIMEZONE
 
 
 async def send_timezone_confirm_step(message, timezone_label: str, prefix: str = "onb") -> int:
     await message.reply_text(
-        COPY["onboarding"]["timezone_confirm"].format(timezone_label=timezone_label),
+        timezone_confirm_text(timezone_label),
         reply_markup=timezone_confirm_markup(prefix=prefix),
     )
     return ONB_TIMEZONE_CONFIRM
 
 
 async def send_other_timezone_step(message) -> int:
-    await message.reply_text(COPY["onboarding"]["screen_4"], reply_markup=other_timezone_markup())
+    await message.reply_text(ONB["screen_4"], reply_markup=other_timezone_markup())
     return ONB_TIMEZONE_CUSTOM
 
 
 async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    user = db.get_user(DB_PATH, user_id)
+    user = get_user_cached(context, user_id)
 
     if user and int(user.get("onboarding_complete", 0)) == 1:
-        mode = COPY["common"]["mode_paused"] if int(user.get("paused", 0)) == 1 else COPY["common"]["mode_active"]
-        status_text = COPY["common"]["onboarding_done_status"].format(
+        mode = COMMON["mode_paused"] if int(user.get("paused", 0)) == 1 else COMMON["mode_active"]
+        status_text = COMMON["onboarding_done_status"].format(
             mode=mode,
             timezone=user.get("timezone") or "—",
             morning_time=user.get("morning_time") or "—",
@@ -439,24 +586,26 @@ async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
 
     if date.today() > END_DATE:
-        await update.message.reply_text(COPY["common"]["already_finished"])
+        await update.message.reply_text(COMMON["already_finished"])
         return ConversationHandler.END
 
     db.upsert_user(DB_PATH, user_id)
+    forget_cached_user(context, user_id)
     clear_onb_draft(user_id)
     return await send_onboarding_start(update.message, user_id)
 
 
 async def restart_onboarding_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if date.today() > END_DATE:
-        await update.message.reply_text(COPY["common"]["already_finished"])
+        await update.message.reply_text(COMMON["already_finished"])
         return ConversationHandler.END
 
     user_id = update.effective_user.id
     db.delete_user(DB_PATH, user_id)
     db.upsert_user(DB_PATH, user_id)
+    forget_cached_user(context, user_id)
     clear_onb_draft(user_id)
-    await update.message.reply_text(COPY["common"]["restart_started"], reply_markup=ReplyKeyboardRemove())
+    await update.message.reply_text(COMMON["restart_started"], reply_markup=ReplyKeyboardRemove())
     return await send_onboarding_start(update.message, user_id)
 
 
@@ -495,23 +644,24 @@ async def admin_nudge_onboarding_cmd(update: Update, context: ContextTypes.DEFAU
         return
 
     targets = db.list_onboarding_incomplete_users(DB_PATH)
+    # One read of the conversation blob and the drafts for the whole batch
+    # instead of two runtime_state round-trips per target.
+    states = _load_all_onboarding_states()
+    drafts = db.get_runtime_states(DB_PATH, [_onb_draft_key(int(row["user_id"])) for row in targets])
     sent = 0
     failed = 0
     for row in targets:
         try:
             target_user_id = int(row["user_id"])
-            state = get_onboarding_state_for_user(target_user_id)
-            draft = get_onb_draft(target_user_id)
+            state = states.get(target_user_id)
+            draft = _parse_onb_draft(drafts.get(_onb_draft_key(target_user_id)))
 
             if state == ONB_START_GATE:
-                kb = InlineKeyboardMarkup(
-                    [[InlineKeyboardButton(COPY["buttons"]["start"], callback_data="onb:start")]]
-                )
-                await context.bot.send_message(chat_id=target_user_id, text=COPY["onboarding"]["screen_1"], reply_markup=kb)
+                await context.bot.send_message(chat_id=target_user_id, text=ONB["screen_1"], reply_markup=_START_MARKUP)
             elif state == ONB_REFLECTION_INPUT:
                 await context.bot.send_message(
                     chat_id=target_user_id,
-                    text=COPY["onboarding"]["screen_3"],
+                    text=ONB["screen_3"],
                     reply_markup=reflection_prompt_markup(),
                 )
             elif state == ONB_REFLECTION_CONFIRM:
@@ -519,25 +669,25 @@ async def admin_nudge_onboarding_cmd(update: Update, context: ContextTypes.DEFAU
                 if reflection_text:
                     await context.bot.send_message(
                         chat_id=target_user_id,
-                        text=COPY["onboarding"]["reflection_confirm"].format(reflection_text=reflection_text),
+                        text=reflection_confirm_text(reflection_text),
                         reply_markup=reflection_confirm_markup(),
                     )
                 else:
                     await context.bot.send_message(
                         chat_id=target_user_id,
-                        text=COPY["onboarding"]["screen_3"],
+                        text=ONB["screen_3"],
                         reply_markup=reflection_prompt_markup(),
                     )
             elif state == ONB_TIMEZONE:
                 await context.bot.send_message(
                     chat_id=target_user_id,
-                    text=COPY["onboarding"]["screen_4"],
+                    text=ONB["screen_4"],
                     reply_markup=timezone_markup(),
                 )
             elif state == ONB_TIMEZONE_CUSTOM:
                 await context.bot.send_message(
                     chat_id=target_user_id,
-                    text=COPY["onboarding"]["screen_4"],
+                    text=ONB["screen_4"],
                     reply_markup=other_timezone_markup(),
                 )
             elif state == ONB_TIMEZONE_CONFIRM:
@@ -545,24 +695,24 @@ async def admin_nudge_onboarding_cmd(update: Update, context: ContextTypes.DEFAU
                 if tz_label:
                     await context.bot.send_message(
                         chat_id=target_user_id,
-                        text=COPY["onboarding"]["timezone_confirm"].format(timezone_label=tz_label),
+                        text=timezone_confirm_text(tz_label),
                         reply_markup=timezone_confirm_markup(),
                     )
                 else:
                     await context.bot.send_message(
                         chat_id=target_user_id,
-                        text=COPY["onboarding"]["screen_4"],
+                        text=ONB["screen_4"],
                         reply_markup=timezone_markup(),
                     )
             elif state == ONB_MORNING:
-                await context.bot.send_message(chat_id=target_user_id, text=COPY["onboarding"]["screen_5"])
-                await context.bot.send_message(chat_id=target_user_id, text=COPY["onboarding"]["screen_6"])
+                await context.bot.send_message(chat_id=target_user_id, text=ONB["screen_5"])
+                await context.bot.send_message(chat_id=target_user_id, text=ONB["screen_6"])
             elif state == ONB_EVENING:
-                await context.bot.send_message(chat_id=target_user_id, text=COPY["onboarding"]["screen_7"])
+                await context.bot.send_message(chat_id=target_user_id, text=ONB["screen_7"])
             else:
                 await context.bot.send_message(
                     chat_id=target_user_id,
-                    text=COPY["onboarding"]["screen_4"],
+                    text=ONB["screen_4"],
                     reply_markup=timezone_markup(),
                 )
             sent += 1
@@ -575,33 +725,33 @@ async def admin_nudge_onboarding_cmd(update: Update, context: ContextTypes.DEFAU
 
 
 async def unknown_command_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user = db.get_user(DB_PATH, update.effective_user.id)
+    user = get_user_cached(context, update.effective_user.id)
     if user and int(user.get("onboarding_complete", 0)) == 1:
         await update.message.reply_text(
-            COPY["common"]["unknown_text"],
+            COMMON["unknown_text"],
             reply_markup=menu_markup_for_user(user),
         )
         return
-    await update.message.reply_text(COPY["common"]["unknown_text"])
+    await update.message.reply_text(COMMON["unknown_text"])
 
 
 async def onb_start_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     clear_onb_draft(update.effective_user.id)
-    await query.message.reply_text(COPY["onboarding"]["screen_2"])
+    await query.message.reply_text(ONB["screen_2"])
     return await send_reflection_prompt(query.message)
 
 
 async def onb_reflection_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = (update.message.text or "").strip()
     if len(text) > 500:
-        await update.message.reply_text(COPY["errors"]["reflection_too_long"])
+        await update.message.reply_text(ERR["reflection_too_long"])
         return ONB_REFLECTION_INPUT
 
     context.user_data["reflection_candidate"] = text
     set_onb_draft(update.effective_user.id, reflection_candidate=text)
-    confirm_text = COPY["onboarding"]["reflection_confirm"].format(reflection_text=text)
+    confirm_text = reflection_confirm_text(text)
     await update.message.reply_text(confirm_text, reply_markup=reflection_confirm_markup())
     return ONB_REFLECTION_CONFIRM
 
@@ -625,7 +775,7 @@ async def onb_reflection_save(update: Update, context: ContextTypes.DEFAULT_TYPE
         reflection_text=context.user_data.get("reflection_candidate"),
         reflection_skipped=0,
     )
-    await query.message.reply_text(COPY["onboarding"]["reflection_saved"])
+    await query.message.reply_text(ONB["reflection_saved"])
     return await send_timezone_step(query.message)
 
 
@@ -644,7 +794,7 @@ async def onb_reflection_back_to_prompt(update: Update, context: ContextTypes.DE
 async def onb_reflection_back_to_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    await query.message.reply_text(COPY["onboarding"]["screen_2"])
+    await query.message.reply_text(ONB["screen_2"])
     return await send_reflection_prompt(query.message)
 
 
@@ -657,7 +807,7 @@ async def onb_timezone_pick(update: Update, context: ContextTypes.DEFAULT_TYPE)
         idx = int(idx_str)
         entry = COPY["timezone_options"][idx]
     except Exception:
-        await query.message.reply_text(COPY["errors"]["timezone_unknown"])
+        await query.message.reply_text(ERR["timezone_unknown"])
         return await send_timezone_step(query.message)
 
     if entry["tz"] == "other":
@@ -682,9 +832,9 @@ async def onb_timezone_custom_pick(update: Update, context: ContextTypes.DEFAULT
             idx = int(data.split(":")[-1])
             chosen = OTHER_TIMEZONE_OPTIONS[idx]
             tz = chosen["tz"]
-            ZoneInfo(tz)
+            _zi(tz)
         except Exception:
-            await query.message.reply_text(COPY["errors"]["timezone_unknown"])
+            await query.message.reply_text(ERR["timezone_unknown"])
             return await send_other_timezone_step(query.message)
 
         context.user_data["timezone"] = tz
@@ -692,26 +842,26 @@ async def onb_timezone_custom_pick(update: Update, context: ContextTypes.DEFAULT
         set_onb_draft(update.effective_user.id, timezone=tz, timezone_label=chosen["label"])
         return await send_timezone_confirm_step(query.message, chosen["label"])
 
-    await query.message.reply_text(COPY["errors"]["timezone_unknown"])
+    await query.message.reply_text(ERR["timezone_unknown"])
     return await send_other_timezone_step(query.message)
 
 
 async def onb_set_morning(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     value = (update.message.text or "").strip()
-    if not TIME_RE.match(value):
-        await update.message.reply_text(COPY["errors"]["invalid_time"])
+    if not _valid_hhmm(value):
+        await update.message.reply_text(ERR["invalid_time"])
         return ONB_MORNING
     context.user_data["morning_time"] = value
     set_onb_draft(update.effective_user.id, morning_time=value)
-    await update.message.reply_text(COPY["onboarding"]["morning_saved"])
-    await update.message.reply_text(COPY["onboarding"]["screen_7"])
+    await update.message.reply_text(ONB["morning_saved"])
+    await update.message.reply_text(ONB["screen_7"])
     return ONB_EVENING
 
 
 async def onb_set_evening(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     value = (update.message.text or "").strip()
-    if not TIME_RE.match(value):
-        await update.message.reply_text(COPY["errors"]["invalid_time"])
+    if not _valid_hhmm(value):
+        await update.message.reply_text(ERR["invalid_time"])
         return ONB_EVENING
 
     draft = get_onb_draft(update.effective_user.id)
@@ -721,21 +871,24 @@ async def onb_set_evening(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     reflection_skipped = int(context.user_data.get("reflection_skipped", draft.get("reflection_skipped", 1)))
 
     if not tz_val or not morning_val:
-        await update.message.reply_text(COPY["errors"]["wrong_input"])
+        await update.message.reply_text(ERR["wrong_input"])
         return await send_timezone_step(update.message)
 
     user_id = update.effective_user.id
     tz = tz_val
-    local_today = datetime.now(timezone.utc).astimezone(ZoneInfo(tz)).date()
+    local_now = datetime.now(timezone.utc).astimezone(_zi(tz))
+    local_today = local_now.date()
 
     if local_today > END_DATE:
-        await update.message.reply_text(COPY["common"]["already_finished"])
+        await update.message.reply_text(COMMON["already_finished"])
         return ConversationHandler.END
 
     start_date = START_DATE if local_today < START_DATE else local_today
-    db.upsert_user(
+    user = db.finish_onboarding(
         DB_PATH,
         user_id,
+        local_today if START_DATE <= local_today <= END_DATE else None,
+        start_date,
         timezone=tz,
         morning_time=morning_val,
         evening_time=value,
@@ -747,32 +900,28 @@ async def onb_set_evening(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reflection_text=reflection_text,
         reflection_skipped=reflection_skipped,
     )
+    remember_cached_user(context, user_id, user)
 
-    if START_DATE <= local_today <= END_DATE:
-        db.ensure_day_row(DB_PATH, user_id, local_today, start_date)
-
-    await update.message.reply_text(COPY["onboarding"]["evening_saved"])
+    await update.message.reply_text(ONB["evening_saved"])
 
     if local_today < START_DATE:
-        finish_text = COPY["onboarding"]["finish_before_start"]
+        finish_text = ONB["finish_before_start"]
     else:
-        messages = [COPY["onboarding"]["finish_base"]]
+        messages = [ONB["finish_base"]]
         if local_today.month == 4 and 1 <= local_today.day <= 4:
-            messages.append(COPY["onboarding"]["finish_april"])
+            messages.append(ONB["finish_april"])
         else:
-            messages.append(COPY["onboarding"]["finish_during"])
+            messages.append(ONB["finish_during"])
         finish_text = "\n\n".join(messages)
 
-    user = db.get_user(DB_PATH, user_id)
     await update.message.reply_text(finish_text, reply_markup=menu_markup_for_user(user))
-    local_now = datetime.now(timezone.utc).astimezone(ZoneInfo(tz))
     await send_onboarding_catchup_messages(update, user, local_now)
     clear_onb_draft(user_id)
     return ConversationHandler.END
 
 
 async def onb_wrong_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text(COPY["errors"]["wrong_input"])
+    await update.message.reply_text(ERR["wrong_input"])
     return await send_onboarding_start(update.message, update.effective_user.id)
 
 
@@ -781,7 +930,7 @@ async def try_handle_time_in_stale_onboarding_state(
 ) -> int | None:
     """Accept HH:MM even if conversation state lagged on serverless runtime."""
     value = (update.message.text or "").strip()
-    if not TIME_RE.match(value):
+    if not _valid_hhmm(value):
         return None
 
     draft = get_onb_draft(update.effective_user.id)
@@ -801,8 +950,8 @@ async def onb_wrong_reflection_confirm(update: Update, context: ContextTypes.DEF
         return time_handled_state
 
     text = context.user_data.get("reflection_candidate", "")
-    await update.message.reply_text(COPY["errors"]["wrong_input"])
-    confirm_text = COPY["onboarding"]["reflection_confirm"].format(reflection_text=text)
+    await update.message.reply_text(ERR["wrong_input"])
+    confirm_text = reflection_confirm_text(text)
     await update.message.reply_text(confirm_text, reply_markup=reflection_confirm_markup())
     return ONB_REFLECTION_CONFIRM
 
@@ -812,15 +961,15 @@ async def onb_wrong_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if time_handled_state is not None:
         return time_handled_state
 
-    await update.message.reply_text(COPY["errors"]["wrong_input"])
+    await update.message.reply_text(ERR["wrong_input"])
     return await send_timezone_step(update.message)
 
 
 async def onb_timezone_confirm_save(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    await query.message.reply_text(COPY["onboarding"]["screen_5"])
-    await query.message.reply_text(COPY["onboarding"]["screen_6"])
+    await query.message.reply_text(ONB["screen_5"])
+    await query.message.reply_text(ONB["screen_6"])
     return ONB_MORNING
 
 
@@ -835,97 +984,76 @@ async def onb_wrong_timezone_confirm(update: Update, context: ContextTypes.DEFAU
     if time_handled_state is not None:
         return time_handled_state
 
-    await update.message.reply_text(COPY["errors"]["wrong_input"])
+    await update.message.reply_text(ERR["wrong_input"])
     label = context.user_data.get("timezone_label") or context.user_data.get("timezone") or "—"
     return await send_timezone_confirm_step(update.message, label)
 
 
+_ONB_STALE_DISPATCH = {
+    "onb:start": onb_start_click,
+    "onb:skip": onb_reflection_skip,
+    "onb:save": onb_reflection_save,
+    "onb:edit": onb_reflection_edit,
+    "onb:back_to_prompt": onb_reflection_back_to_prompt,
+    "onb:back_to_welcome": onb_reflection_back_to_welcome,
+    "onb:tz_save": onb_timezone_confirm_save,
+    "onb:tz_edit": onb_timezone_confirm_edit,
+}
+
+
 async def onb_stale_callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Recover onboarding flow if callback arrived while conversation state is stale."""
     query = update.callback_query
     data = query.data or ""
 
-    if data == "onb:start":
-        return await onb_start_click(update, context)
-    if data == "onb:skip":
-        return await onb_reflection_skip(update, context)
-    if data == "onb:save":
-        return await onb_reflection_save(update, context)
-    if data == "onb:edit":
-        return await onb_reflection_edit(update, context)
-    if data == "onb:back_to_prompt":
-        return await onb_reflection_back_to_prompt(update, context)
-    if data == "onb:back_to_welcome":
-        return await onb_reflection_back_to_welcome(update, context)
+    handler = _ONB_STALE_DISPATCH.get(data)
+    if handler is not None:
+        return await handler(update, context)
     if data.startswith("tz:"):
         return await onb_timezone_pick(update, context)
     if data.startswith("tzother:"):
         return await onb_timezone_custom_pick(update, context)
-    if data == "onb:tz_save":
-        return await onb_timezone_confirm_save(update, context)
-    if data == "onb:tz_edit":
-        return await onb_timezone_confirm_edit(update, context)
 
     await query.answer()
     return ConversationHandler.END
 
 
 async def change_time_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    rows = [
-        [COPY["buttons"]["change_morning"]],
-        [COPY["buttons"]["change_evening"]],
-        [COPY["buttons"]["back"]],
-    ]
-    await update.message.reply_text(COPY["common"]["choose_time_target"], reply_markup=choice_markup(rows))
+    await update.message.reply_text(COMMON["choose_time_target"], reply_markup=_CHANGE_TARGET_MARKUP)
     return CHANGE_TARGET
 
 
 async def change_time_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if text == COPY["buttons"]["back"]:
-        await update.message.reply_text(
-            COPY["common"]["back_keep"],
-            reply_markup=menu_markup_for_user_id(update.effective_user.id),
-        )
+    if text == BUTTONS["back"]:
+        user = get_user_cached(context, update.effective_user.id)
+        await update.message.reply_text(COMMON["back_keep"], reply_markup=menu_markup_for_user(user))
         return ConversationHandler.END
 
-    if text == COPY["buttons"]["change_morning"]:
+    if text == BUTTONS["change_morning"]:
         context.user_data["change_target"] = "morning"
-    elif text == COPY["buttons"]["change_evening"]:
+    elif text == BUTTONS["change_evening"]:
         context.user_data["change_target"] = "evening"
     else:
-        rows = [
-            [COPY["buttons"]["change_morning"]],
-            [COPY["buttons"]["change_evening"]],
-            [COPY["buttons"]["back"]],
-        ]
-        await update.message.reply_text(COPY["errors"]["wrong_input"])
-        await update.message.reply_text(COPY["common"]["choose_time_target"], reply_markup=choice_markup(rows))
+        await update.message.reply_text(ERR["wrong_input"])
+        await update.message.reply_text(COMMON["choose_time_target"], reply_markup=_CHANGE_TARGET_MARKUP)
         return CHANGE_TARGET
 
-    await update.message.reply_text(
-        COPY["common"]["prompt_new_time"],
-        reply_markup=menu_markup_for_user_id(update.effective_user.id),
-    )
+    user = get_user_cached(context, update.effective_user.id)
+    await update.message.reply_text(COMMON["prompt_new_time"], reply_markup=menu_markup_for_user(user))
     return CHANGE_VALUE
 
 
 async def change_time_value(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     value = (update.message.text or "").strip()
-    if not TIME_RE.match(value):
-        await update.message.reply_text(COPY["errors"]["invalid_time"])
-        await update.message.reply_text(
-            COPY["common"]["prompt_new_time"],
-            reply_markup=menu_markup_for_user_id(update.effective_user.id),
-        )
+    user = get_user_cached(context, update.effective_user.id)
+    if not _valid_hhmm(value):
+        await update.message.reply_text(ERR["invalid_time"])
+        await update.message.reply_text(COMMON["prompt_new_time"], reply_markup=menu_markup_for_user(user))
         return CHANGE_VALUE
 
-    user = db.get_user(DB_PATH, update.effective_user.id)
     if not user or not user.get("timezone"):
-        await update.message.reply_text(
-            COPY["common"]["back_keep"],
-            reply_markup=menu_markup_for_user_id(update.effective_user.id),
-        )
+        await update.message.reply_text(COMMON["back_keep"], reply_markup=menu_markup_for_user(user))
         return ConversationHandler.END
 
     local_today = local_today_for_user(user)
@@ -937,45 +1065,88 @@ async def change_time_value(update: Update, context: ContextTypes.DEFAULT_TYPE)
         value,
         effective_from,
     )
-    await update.message.reply_text(
-        COPY["common"]["change_applies_tomorrow"],
-        reply_markup=menu_markup_for_user_id(update.effective_user.id),
-    )
+    await update.message.reply_text(COMMON["change_applies_tomorrow"], reply_markup=menu_markup_for_user(user))
     return ConversationHandler.END
 
 
+# chat id -> replies still in flight for that chat.
+_PENDING_REPLIES: dict[int, set[asyncio.Task]] = {}
+
+
+def _on_reply_done(chat_id: int, task: asyncio.Task) -> None:
+    pending = _PENDING_REPLIES.get(chat_id)
+    if pending is not None:
+        pending.discard(task)
+        if not pending:
+            del _PENDING_REPLIES[chat_id]
+    if not task.cancelled() and task.exception() is not None:
+        LOGGER.error("reply failed", exc_info=task.exception())
+
+
+def reply_later(chat_id: int, coro) -> None:
+    """Send a handler's last reply without holding the update until Telegram answers.
+
+    Only for replies nothing else in the handler depends on. The chat's next
+    update waits for them, so replies within a chat keep their order.
+    """
+    task = asyncio.create_task(coro)
+    _PENDING_REPLIES.setdefault(chat_id, set()).add(task)
+    task.add_done_callback(functools.partial(_on_reply_done, chat_id))
+
+
+async def drain_pending_replies(chat_id: int | None = None) -> None:
+    # Without a chat id, waits for every chat's replies.
+    while True:
+        if chat_id is None:
+            tasks = [task for pending in _PENDING_REPLIES.values() for task in pending]
+        else:
+            tasks = list(_PENDING_REPLIES.get(chat_id, ()))
+        if not tasks:
+            return
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def pause_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user = db.get_user(DB_PATH, update.effective_user.id)
+    user = get_user_cached(context, update.effective_user.id)
     if not user:
         return
     db.set_pause(DB_PATH, update.effective_user.id, True)
-    user = db.get_user(DB_PATH, update.effective_user.id)
-    await update.message.reply_text(COPY["common"]["pause_on"], reply_markup=menu_markup_for_user(user))
+    user = {**user, "paused": 1}
+    remember_cached_user(context, update.effective_user.id, user)
+    reply_later(
+        update.effective_chat.id,
+        update.message.reply_text(COMMON["pause_on"], reply_markup=menu_markup_for_user(user)),
+    )
 
 
 async def resume_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user = db.get_user(DB_PATH, update.effective_user.id)
+    user = get_user_cached(context, update.effective_user.id)
     if not user:
         return
     db.set_pause(DB_PATH, update.effective_user.id, False)
-    user = db.get_user(DB_PATH, update.effective_user.id)
-    await update.message.reply_text(COPY["common"]["pause_off"], reply_markup=menu_markup_for_user(user))
+    user = {**user, "paused": 0}
+    remember_cached_user(context, update.effective_user.id, user)
+    reply_later(
+        update.effective_chat.id,
+        update.message.reply_text(COMMON["pause_off"], reply_markup=menu_markup_for_user(user)),
+    )
 
 
 async def evening_status_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = (update.message.text or "").strip()
-    user = db.get_user(DB_PATH, update.effective_user.id)
+    user = get_user_cached(context, update.effective_user.id)
     if not user or int(user.get("onboarding_complete", 0)) == 0:
-        await update.message.reply_text(COPY["common"]["unknown_text"])
+        await update.message.reply_text(COMMON["unknown_text"])
         return
 
-    if text == COPY["buttons"]["edit_answer"]:
-        await update.message.reply_text(COPY["evening"]["repeat_prompt"], reply_markup=evening_choice_markup(user))
+    action = button_action(text)
+    if action == "edit":
+        await update.message.reply_text(EVENING["repeat_prompt"], reply_markup=evening_choice_markup(user))
         return
 
-    status = parse_status_from_text(text)
-    tz = ZoneInfo(user["timezone"])
-    local_date = datetime.now(timezone.utc).astimezone(tz).date()
+    status = action if action in _STATUS_ACTIONS else None
+    now_utc = datetime.now(timezone.utc)
+    local_date = now_utc.astimezone(_zi(user["timezone"])).date()
     start_date = date.fromisoformat(user["start_date"])
 
     if status is None:
@@ -983,12 +1154,12 @@ async def evening_status_handler(update: Update, context: ContextTypes.DEFAULT_T
         day = db.get_day(DB_PATH, update.effective_user.id, local_date)
         waiting_answer = has_evening and (day is None or day.get("status") is None)
         if waiting_answer and not is_menu_button_text(text, user):
-            await update.message.reply_text(COPY["errors"]["wrong_input"])
-            await update.message.reply_text(COPY["evening"]["repeat_prompt"], reply_markup=evening_choice_markup(user))
+            await update.message.reply_text(ERR["wrong_input"])
+            await update.message.reply_text(EVENING["repeat_prompt"], reply_markup=evening_choice_markup(user))
             return
         if not waiting_answer and not is_menu_button_text(text, user):
             await update.message.reply_text(
-                COPY["common"]["unknown_text"],
+                COMMON["unknown_text"],
                 reply_markup=menu_markup_for_user(user),
             )
         return
@@ -996,285 +1167,309 @@ async def evening_status_handler(update: Update, context: ContextTypes.DEFAULT_T
     if local_date < start_date or local_date > END_DATE:
         return
 
-    db.ensure_day_row(DB_PATH, update.effective_user.id, local_date, start_date)
-    allowed = db.can_update_evening_status(
+    saved = db.save_evening_status(
         DB_PATH,
         update.effective_user.id,
         local_date,
-        datetime.now(timezone.utc),
+        start_date,
+        status,
+        now_utc,
     )
-    if not allowed:
+    if not saved:
         return
 
-    db.set_day_status(DB_PATH, update.effective_user.id, local_date, status)
-    user = db.get_user(DB_PATH, update.effective_user.id)
-    await update.message.reply_text(COPY["evening"]["accepted"], reply_markup=post_answer_markup(user))
+    await update.message.reply_text(EVENING["accepted"], reply_markup=post_answer_markup(user))
 
 
 async def thanks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
+    user = get_user_cached(context, update.effective_user.id)
+    reply_later(
+        update.effective_chat.id,
+        query.message.reply_text(COMMON["presence_reply"], reply_markup=menu_markup_for_user(user)),
+    )
     await query.answer()
-    user = db.get_user(DB_PATH, update.effective_user.id)
-    await query.message.reply_text(COPY["common"]["presence_reply"], reply_markup=menu_markup_for_user(user))
+
+
+async def _answer_and_send_closing(query) -> Exception | None:
+    # A failed answer only leaves the button spinner up; only a failed closing
+    # message is returned, so the caller can give back its claim.
+    answered, closing = await asyncio.gather(
+        query.answer(), query.message.reply_text(FINAL["closing"]), return_exceptions=True
+    )
+    if isinstance(answered, Exception):
+        LOGGER.warning("callback answer failed", exc_info=answered)
+    return closing if isinstance(closing, Exception) else None
 
 
 async def final_thanks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
     user_id = update.effective_user.id
     db.upsert_user(DB_PATH, user_id)
+    forget_cached_user(context, user_id)
+
+    # Claimed first so a double tap cannot send the follow-up twice.
+    if not db.record_sent_message(DB_PATH, user_id, END_DATE, "final_followup"):
+        await query.answer()
+        return
+    error = await _answer_and_send_closing(query)
+    if error is not None:
+        db.release_sent_messages(DB_PATH, user_id, END_DATE, ["final_followup"])
+        raise error
+    await query.message.reply_text(FINAL["contacts"], reply_markup=ReplyKeyboardRemove())
+
+
+TEST_STATE_KEY = "test"
+
+
+@dataclass(slots=True)
+class TestState:
+    # Stored in user_data as a plain dict (see to_dict) so persistence can
+    # still serialize it to JSON.
+    scenario: str = "before"
+    index: int = 0
+    waiting_reflection: bool = False
+    waiting_reflection_confirm: bool = False
+    waiting_time_input: str | None = None
+    waiting_timezone_confirm: bool = False
+    waiting_evening_status: bool = False
+    waiting_day_next: bool = False
+    pending_day_status: str | None = None
+    day_loop_active: bool = False
+    stats: dict = field(default_factory=lambda: {"full": 0, "partial": 0, "none": 0})
+    prev_unmarked: bool = False
+    final_followup_sent: bool = False
+    day: int = 1
+    total_days: int = 46
+    days_left_start: int = 46
+    reflection_text: str = ""
+    reflection_candidate: str = ""
+    timezone_label: str = "—"
+    timezone_tz: str | None = None
+
+    @property
+    def steps(self) -> tuple[str, ...]:
+        return build_test_steps(self.scenario)
+
+    def is_last_step(self) -> bool:
+        last = _TEST_LAST_INDEX.get(self.scenario)
+        if last is None:
+            last = len(self.steps) - 1
+        return self.index >= last
+
+    def reset_waiting(self, reflection: bool = False, time_input: str | None = None) -> None:
+        self.waiting_reflection = reflection
+        self.waiting_reflection_confirm = False
+        self.waiting_time_input = time_input
+        self.waiting_timezone_confirm = False
+        self.waiting_evening_status = False
+
+    def count_pending_day(self) -> None:
+        pending = self.pending_day_status
+        if pending in {"full", "partial", "none"}:
+            self.stats[pending] = int(self.stats.get(pending, 0)) + 1
+            self.prev_unmarked = False
+            self.pending_day_status = None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in _TEST_STATE_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "TestState":
+        if not isinstance(data, dict):
+            return cls()
+        return cls(**{k: v for k, v in data.items() if k in _TEST_STATE_FIELDS})
 
-    if not db.has_sent_message(DB_PATH, user_id, END_DATE, "final_followup"):
-        await query.message.reply_text(COPY["final"]["closing"])
-        await query.message.reply_text(COPY["final"]["contacts"], reply_markup=ReplyKeyboardRemove())
-        db.record_sent_message(DB_PATH, user_id, END_DATE, "final_followup")
 
+_TEST_STATE_FIELDS = frozenset(f.name for f in fields(TestState))
+
+
+def _with_test_state(handler):
+    # Loads the test-mode state once per update and writes it back afterwards.
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        st = TestState.from_dict(context.user_data.get(TEST_STATE_KEY))
+        try:
+            return await handler(update, context, st)
+        finally:
+            context.user_data[TEST_STATE_KEY] = st.to_dict()
 
-async def test_final_thanks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    return wrapper
+
+
+@_with_test_state
+async def test_final_thanks_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> None:
     query = update.callback_query
-    await query.answer()
-    if context.user_data.get("test_final_followup_sent", False):
+    if st.final_followup_sent:
+        await query.answer()
         return
-    context.user_data["test_final_followup_sent"] = True
-    await query.message.reply_text(COPY["final"]["closing"])
-    await query.message.reply_text(COPY["final"]["contacts"], reply_markup=ReplyKeyboardRemove())
+    st.final_followup_sent = True
+    error = await _answer_and_send_closing(query)
+    if error is not None:
+        st.final_followup_sent = False
+        raise error
+    await query.message.reply_text(FINAL["contacts"], reply_markup=ReplyKeyboardRemove())
 
 
 async def test_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    kb = InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton(COPY["buttons"]["scenario_before"], callback_data="test:before")],
-            [InlineKeyboardButton(COPY["buttons"]["scenario_during"], callback_data="test:during")],
-            [InlineKeyboardButton(COPY["buttons"]["scenario_april"], callback_data="test:april")],
-            [InlineKeyboardButton(COPY["buttons"]["scenario_after"], callback_data="test:after")],
-        ]
-    )
     await update.message.reply_text(COPY["test_mode"]["intro"])
-    await update.message.reply_text(COPY["common"]["test_pick"], reply_markup=kb)
+    await update.message.reply_text(COMMON["test_pick"], reply_markup=_TEST_PICK_MARKUP)
     return TEST_PICK
 
 
 async def test_pick_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    scenario = query.data.split(":", 1)[1]
-    context.user_data["test_scenario"] = scenario
-    context.user_data["test_steps"] = build_test_steps(scenario)
-    context.user_data["test_index"] = 0
-    context.user_data["test_waiting_reflection"] = False
-    context.user_data["test_waiting_reflection_confirm"] = False
-    context.user_data["test_waiting_time_input"] = None
-    context.user_data["test_waiting_timezone_confirm"] = False
-    context.user_data["test_waiting_evening_status"] = False
-    context.user_data["test_waiting_day_next"] = False
-    context.user_data["test_pending_day_status"] = None
-    context.user_data["test_day_loop_active"] = False
-    context.user_data["test_stats"] = {"full": 0, "partial": 0, "none": 0}
-    context.user_data["test_prev_unmarked"] = False
-    context.user_data["test_final_followup_sent"] = False
-    await send_test_step(query.message, context)
+    st = TestState(scenario=query.data.split(":", 1)[1])
+    try:
+        await send_test_step(query.message, st)
+    finally:
+        context.user_data[TEST_STATE_KEY] = st.to_dict()
     return TEST_RUN
 
 
-async def send_test_day_prompt(message, context: ContextTypes.DEFAULT_TYPE) -> None:
-    day = int(context.user_data["test_day"])
-    total_days = int(context.user_data["test_total_days"])
-    days_left_start = int(context.user_data["test_days_left_start"])
+async def send_test_day_prompt(message, st: TestState) -> None:
+    day = st.day
+    total_days = st.total_days
 
     if day == total_days:
-        morning_text = COPY["morning"]["last_day"]
+        morning_text = MORNING["last_day"]
     else:
-        days_left = max(days_left_start - (day - 1), 0)
-        morning_text = COPY["morning"]["base"].format(day_number=day, days_left=days_left)
-        if context.user_data.get("test_prev_unmarked", False):
-            morning_text = f"{COPY['morning']['yesterday_missed']}\n\n{morning_text}"
+        days_left = max(st.days_left_start - (day - 1), 0)
+        morning_text = morning_base_text(day, days_left)
+        if st.prev_unmarked:
+            morning_text = f"{MORNING['yesterday_missed']}\n\n{morning_text}"
 
     await message.reply_text(morning_text)
 
     if day != total_days:
         quote_idx = max(day - 1, 0)
-        quote = QUOTES[quote_idx] if quote_idx < len(QUOTES) else "—"
-        quote_text = COPY["morning"]["quote_message"].format(quote=f"<i>{html.escape(quote)}</i>")
-        await message.reply_text(quote_text, parse_mode="HTML")
+        quote_text, quote_entities = QUOTE_MESSAGES[quote_idx] if quote_idx < len(QUOTE_MESSAGES) else QUOTE_FALLBACK
+        await message.reply_text(quote_text, entities=quote_entities)
 
     if PRESENCE and day % 4 == 0 and day <= 44:
         presence_index = (day // 4) - 1
         if 0 <= presence_index < len(PRESENCE):
             await message.reply_text(PRESENCE[presence_index])
 
-    rows = [
-        [COPY["buttons"]["status_full"]],
-        [COPY["buttons"]["status_partial"]],
-        [COPY["buttons"]["status_none"]],
-        [COPY["buttons"]["next"]],
-        [COPY["buttons"]["skip_to_final"]],
-    ]
-    await message.reply_text(COPY["evening"]["prompt"], reply_markup=choice_markup(rows))
-    context.user_data["test_waiting_evening_status"] = True
-    context.user_data["test_waiting_day_next"] = False
-    context.user_data["test_pending_day_status"] = None
-
-
-async def send_test_final(message, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data["test_waiting_evening_status"] = False
-    context.user_data["test_waiting_day_next"] = False
-    pending = context.user_data.get("test_pending_day_status")
-    if pending in {"full", "partial", "none"}:
-        stats = context.user_data.get("test_stats", {"full": 0, "partial": 0, "none": 0})
-        stats[pending] = int(stats.get(pending, 0)) + 1
-        context.user_data["test_stats"] = stats
-        context.user_data["test_pending_day_status"] = None
-        context.user_data["test_prev_unmarked"] = False
-    stats = context.user_data.get("test_stats", {"full": 0, "partial": 0, "none": 0})
+    await message.reply_text(EVENING["prompt"], reply_markup=_TEST_EVENING_PROMPT_MARKUP)
+    st.waiting_evening_status = True
+    st.waiting_day_next = False
+    st.pending_day_status = None
+
+
+async def send_test_final(message, st: TestState) -> int:
+    st.waiting_evening_status = False
+    st.waiting_day_next = False
+    st.count_pending_day()
+    stats = st.stats
     total = int(stats.get("full", 0)) + int(stats.get("partial", 0)) + int(stats.get("none", 0))
-    await message.reply_text(COPY["final"]["title"])
-    stats_text = COPY["final"]["stats"].format(
+    await message.reply_text(FINAL["title"])
+    stats_text = FINAL["stats"].format(
         total=total,
         full=int(stats.get("full", 0)),
         partial=int(stats.get("partial", 0)),
         none=int(stats.get("none", 0)),
     )
-    reflection = (context.user_data.get("test_reflection_text") or "").strip()
-    kb = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(COPY["buttons"]["thanks"], callback_data="test:final:thanks")]]
-    )
+    reflection = (st.reflection_text or "").strip()
     if reflection:
         await message.reply_text(stats_text)
-        await message.reply_text(COPY["final"]["reflection"].format(reflection_text=reflection))
-        await message.reply_text(COPY["final"]["reflection_invite"], reply_markup=kb)
+        await message.reply_text(FINAL["reflection"].format(reflection_text=reflection))
+        await message.reply_text(FINAL["reflection_invite"], reply_markup=_TEST_FINAL_THANKS_MARKUP)
     else:
-        await message.reply_text(stats_text, reply_markup=kb)
+        await message.reply_text(stats_text, reply_markup=_TEST_FINAL_THANKS_MARKUP)
     return ConversationHandler.END
 
 
-async def send_test_step(message, context: ContextTypes.DEFAULT_TYPE) -> None:
-    steps = context.user_data["test_steps"]
-    idx = context.user_data["test_index"]
+async def send_test_step(message, st: TestState) -> None:
+    steps = st.steps
+    idx = st.index
     text = steps[idx]
-    quote_prefix = COPY["morning"]["quote_message"].split("{quote}", 1)[0]
     if text == "__TEST_DAY_LOOP__":
-        scenario = context.user_data.get("test_scenario", "before")
-        total_days, days_left_start = test_day_params(scenario)
-        context.user_data["test_day_loop_active"] = True
-        context.user_data["test_day"] = 1
-        context.user_data["test_total_days"] = total_days
-        context.user_data["test_days_left_start"] = days_left_start
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_waiting_evening_status"] = False
-        await send_test_day_prompt(message, context)
+        st.total_days, st.days_left_start = test_day_params(st.scenario)
+        st.day_loop_active = True
+        st.day = 1
+        st.reset_waiting()
+        await send_test_day_prompt(message, st)
         return
 
-    if text == COPY["onboarding"]["screen_3"]:
-        context.user_data["test_waiting_reflection"] = True
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
+    if text == ONB["screen_3"]:
+        st.reset_waiting(reflection=True)
         await message.reply_text(text)
-    elif text == COPY["onboarding"]["screen_4"]:
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
-        rows = []
-        for i, item in enumerate(COPY["timezone_options"]):
-            rows.append([InlineKeyboardButton(item["label"], callback_data=f"test:tz:{i}")])
-        await message.reply_text(text, reply_markup=InlineKeyboardMarkup(rows))
-    elif text == COPY["onboarding"]["screen_6"]:
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = "morning"
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
+    elif text == ONB["screen_4"]:
+        st.reset_waiting()
+        await message.reply_text(text, reply_markup=_TEST_TZ_MARKUP)
+    elif text == ONB["screen_6"]:
+        st.reset_waiting(time_input="morning")
         await message.reply_text(text)
-    elif text == COPY["onboarding"]["screen_7"]:
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = "evening"
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
+    elif text == ONB["screen_7"]:
+        st.reset_waiting(time_input="evening")
         await message.reply_text(text)
     elif idx < len(steps) - 1:
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
-        kb = InlineKeyboardMarkup(
-            [[InlineKeyboardButton(COPY["buttons"]["next"], callback_data="test:next")]]
-        )
-        if text.startswith(quote_prefix):
-            await message.reply_text(text, reply_markup=kb, parse_mode="HTML")
+        st.reset_waiting()
+        if text.startswith(QUOTE_PREFIX):
+            await message.reply_text(text, reply_markup=_TEST_NEXT_MARKUP, parse_mode="HTML")
         else:
-            await message.reply_text(text, reply_markup=kb)
+            await message.reply_text(text, reply_markup=_TEST_NEXT_MARKUP)
     else:
-        context.user_data["test_waiting_reflection"] = False
-        context.user_data["test_waiting_reflection_confirm"] = False
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_waiting_evening_status"] = False
-        if text.startswith(quote_prefix):
+        st.reset_waiting()
+        if text.startswith(QUOTE_PREFIX):
             await message.reply_text(text, parse_mode="HTML")
         else:
             await message.reply_text(text)
 
 
-async def test_next_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@_with_test_state
+async def test_next_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
     query = update.callback_query
     await query.answer()
-    context.user_data["test_index"] += 1
-    await send_test_step(query.message, context)
-    if context.user_data.get("test_day_loop_active", False):
+    st.index += 1
+    await send_test_step(query.message, st)
+    if st.day_loop_active:
         return TEST_RUN
-    steps = context.user_data["test_steps"]
-    idx = context.user_data["test_index"]
-    if idx >= len(steps) - 1:
+    if st.is_last_step():
         return ConversationHandler.END
     return TEST_RUN
 
 
-async def test_timezone_pick_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@_with_test_state
+async def test_timezone_pick_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
     query = update.callback_query
     await query.answer()
     idx = int(query.data.split(":")[-1])
     entry = COPY["timezone_options"][idx]
     if entry["tz"] == "other":
-        await query.message.reply_text(COPY["onboarding"]["screen_4"], reply_markup=test_other_timezone_markup())
+        await query.message.reply_text(ONB["screen_4"], reply_markup=test_other_timezone_markup())
         return TEST_RUN
 
-    context.user_data["test_waiting_timezone_confirm"] = True
-    context.user_data["test_timezone_label"] = entry["label"]
-    context.user_data["test_timezone_tz"] = entry["tz"]
+    st.waiting_timezone_confirm = True
+    st.timezone_label = entry["label"]
+    st.timezone_tz = entry["tz"]
     await query.message.reply_text(
-        COPY["onboarding"]["timezone_confirm"].format(timezone_label=entry["label"]),
+        timezone_confirm_text(entry["label"]),
         reply_markup=timezone_confirm_markup(prefix="test"),
     )
     return TEST_RUN
 
 
-async def test_other_timezone_pick_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@_with_test_state
+async def test_other_timezone_pick_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
     query = update.callback_query
     await query.answer()
     data = query.data
 
     if data == "test:tzother:back":
-        rows = []
-        for i, item in enumerate(COPY["timezone_options"]):
-            rows.append([InlineKeyboardButton(item["label"], callback_data=f"test:tz:{i}")])
-        await query.message.reply_text(COPY["onboarding"]["screen_4"], reply_markup=InlineKeyboardMarkup(rows))
+        await query.message.reply_text(ONB["screen_4"], reply_markup=_TEST_TZ_MARKUP)
         return TEST_RUN
 
     if data.startswith("test:tzother:pick:"):
         idx = int(data.split(":")[-1])
         chosen = OTHER_TIMEZONE_OPTIONS[idx]
-        context.user_data["test_waiting_timezone_confirm"] = True
-        context.user_data["test_timezone_label"] = chosen["label"]
-        context.user_data["test_timezone_tz"] = chosen["tz"]
+        st.waiting_timezone_confirm = True
+        st.timezone_label = chosen["label"]
+        st.timezone_tz = chosen["tz"]
         await query.message.reply_text(
-            COPY["onboarding"]["timezone_confirm"].format(timezone_label=chosen["label"]),
+            timezone_confirm_text(chosen["label"]),
             reply_markup=timezone_confirm_markup(prefix="test"),
         )
         return TEST_RUN
@@ -1282,208 +1477,233 @@ async def test_other_timezone_pick_handler(update: Update, context: ContextTypes
     return TEST_RUN
 
 
-async def test_timezone_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@_with_test_state
+async def test_timezone_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
     query = update.callback_query
     await query.answer()
-    if not context.user_data.get("test_waiting_timezone_confirm", False):
+    if not st.waiting_timezone_confirm:
         return TEST_RUN
 
     action = query.data.split(":")[-1]
     if action == "tz_edit":
-        context.user_data["test_waiting_timezone_confirm"] = False
-        rows = []
-        for i, item in enumerate(COPY["timezone_options"]):
-            rows.append([InlineKeyboardButton(item["label"], callback_data=f"test:tz:{i}")])
-        await query.message.reply_text(COPY["onboarding"]["screen_4"], reply_markup=InlineKeyboardMarkup(rows))
+        st.waiting_timezone_confirm = False
+        await query.message.reply_text(ONB["screen_4"], reply_markup=_TEST_TZ_MARKUP)
         return TEST_RUN
 
     if action == "tz_save":
-        context.user_data["test_waiting_timezone_confirm"] = False
-        context.user_data["test_index"] += 1
-        await send_test_step(query.message, context)
-        steps = context.user_data["test_steps"]
-        idx = context.user_data["test_index"]
-        if idx >= len(steps) - 1:
+        st.waiting_timezone_confirm = False
+        st.index += 1
+        await send_test_step(query.message, st)
+        if st.is_last_step():
             return ConversationHandler.END
         return TEST_RUN
 
     return TEST_RUN
 
 
-async def test_reflection_input_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if context.user_data.get("test_waiting_timezone_confirm", False):
-        label = context.user_data.get("test_timezone_label", "—")
-        await update.message.reply_text(COPY["errors"]["wrong_input"])
+@_with_test_state
+async def test_reflection_input_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
+    if st.waiting_timezone_confirm:
+        await update.message.reply_text(ERR["wrong_input"])
         await update.message.reply_text(
-            COPY["onboarding"]["timezone_confirm"].format(timezone_label=label),
+            timezone_confirm_text(st.timezone_label),
             reply_markup=timezone_confirm_markup(prefix="test"),
         )
         return TEST_RUN
 
-    if context.user_data.get("test_day_loop_active", False):
-        text = (update.message.text or "").strip()
-        if text == COPY["buttons"]["skip_to_final"]:
-            return await send_test_final(update.message, context)
-
-    if context.user_data.get("test_waiting_day_next", False):
-        text = (update.message.text or "").strip()
-        if text == COPY["buttons"]["skip_to_final"]:
-            return await send_test_final(update.message, context)
-        if text == COPY["buttons"]["edit_answer"]:
-            context.user_data["test_waiting_day_next"] = False
-            context.user_data["test_waiting_evening_status"] = True
-            context.user_data["test_pending_day_status"] = None
-            rows = [
-                [COPY["buttons"]["status_full"]],
-                [COPY["buttons"]["status_partial"]],
-                [COPY["buttons"]["status_none"]],
-                [COPY["buttons"]["next"]],
-                [COPY["buttons"]["skip_to_final"]],
-            ]
-            await update.message.reply_text(COPY["evening"]["repeat_prompt"], reply_markup=choice_markup(rows))
+    text = (update.message.text or "").strip()
+    action = button_action(text)
+    if action == "skip" and (st.day_loop_active or st.waiting_day_next):
+        return await send_test_final(update.message, st)
+
+    if st.waiting_day_next:
+        if action == "edit":
+            st.waiting_day_next = False
+            st.waiting_evening_status = True
+            st.pending_day_status = None
+            await update.message.reply_text(EVENING["repeat_prompt"], reply_markup=_TEST_EVENING_PROMPT_MARKUP)
             return TEST_RUN
-        if text != COPY["buttons"]["next"]:
-            await update.message.reply_text(COPY["errors"]["wrong_input"])
-            rows = [
-                [COPY["buttons"]["edit_answer"]],
-                [COPY["buttons"]["next"]],
-                [COPY["buttons"]["skip_to_final"]],
-            ]
-            await update.message.reply_text(COPY["buttons"]["next"], reply_markup=choice_markup(rows))
+        if action != "next":
+            await update.message.reply_text(ERR["wrong_input"])
+            await update.message.reply_text(BUTTONS["next"], reply_markup=_TEST_DAY_NEXT_MARKUP)
             return TEST_RUN
 
-        context.user_data["test_waiting_day_next"] = False
-        pending = context.user_data.get("test_pending_day_status")
-        if pending in {"full", "partial", "none"}:
-            stats = context.user_data.get("test_stats", {"full": 0, "partial": 0, "none": 0})
-            stats[pending] = int(stats.get(pending, 0)) + 1
-            context.user_data["test_stats"] = stats
-            context.user_data["test_prev_unmarked"] = False
-            context.user_data["test_pending_day_status"] = None
-        current_day = int(context.user_data.get("test_day", 1))
-        total_days = int(context.user_data.get("test_total_days", 46))
-        if current_day >= total_days:
-            return await send_test_final(update.message, context)
-
-        context.user_data["test_day"] = current_day + 1
-        await send_test_day_prompt(update.message, context)
+        st.waiting_day_next = False
+        st.count_pending_day()
+        if st.day >= st.total_days:
+            return await send_test_final(update.message, st)
+
+        st.day += 1
+        await send_test_day_prompt(update.message, st)
         return TEST_RUN
 
-    if context.user_data.get("test_waiting_evening_status", False):
-        text = (update.message.text or "").strip()
-        status = parse_status_from_text(text)
-        if status is not None:
-            rows = [
-                [COPY["buttons"]["edit_answer"]],
-                [COPY["buttons"]["next"]],
-                [COPY["buttons"]["skip_to_final"]],
-            ]
-            await update.message.reply_text(COPY["evening"]["accepted"], reply_markup=choice_markup(rows))
-            context.user_data["test_pending_day_status"] = status
-            context.user_data["test_waiting_evening_status"] = False
-            context.user_data["test_waiting_day_next"] = True
+    if st.waiting_evening_status:
+        if action in _STATUS_ACTIONS:
+            await update.message.reply_text(EVENING["accepted"], reply_markup=_TEST_DAY_NEXT_MARKUP)
+            st.pending_day_status = action
+            st.waiting_evening_status = False
+            st.waiting_day_next = True
             return TEST_RUN
 
-        if text == COPY["buttons"]["next"]:
-            context.user_data["test_prev_unmarked"] = True
-            context.user_data["test_waiting_evening_status"] = False
-            context.user_data["test_pending_day_status"] = None
-            rows = [[COPY["buttons"]["next"]], [COPY["buttons"]["skip_to_final"]]]
-            await update.message.reply_text(COPY["evening"]["reminder"], reply_markup=choice_markup(rows))
-            context.user_data["test_waiting_day_next"] = True
+        if action == "next":
+            st.prev_unmarked = True
+            st.waiting_evening_status = False
+            st.pending_day_status = None
+            await update.message.reply_text(EVENING["reminder"], reply_markup=_TEST_REMINDER_NEXT_MARKUP)
+            st.waiting_day_next = True
             return TEST_RUN
 
-        if text == COPY["buttons"]["skip_to_final"]:
-            context.user_data["test_waiting_evening_status"] = False
-            return await send_test_final(update.message, context)
-
-        await update.message.reply_text(COPY["errors"]["wrong_input"])
-        rows = [
-            [COPY["buttons"]["status_full"]],
-            [COPY["buttons"]["status_partial"]],
-            [COPY["buttons"]["status_none"]],
-            [COPY["buttons"]["next"]],
-            [COPY["buttons"]["skip_to_final"]],
-        ]
-        await update.message.reply_text(COPY["evening"]["prompt"], reply_markup=choice_markup(rows))
+        if action == "skip":
+            st.waiting_evening_status = False
+            return await send_test_final(update.message, st)
+
+        await update.message.reply_text(ERR["wrong_input"])
+        await update.message.reply_text(EVENING["prompt"], reply_markup=_TEST_EVENING_PROMPT_MARKUP)
         return TEST_RUN
 
-    if context.user_data.get("test_waiting_time_input"):
-        value = (update.message.text or "").strip()
-        if not TIME_RE.match(value):
-            await update.message.reply_text(COPY["errors"]["invalid_time"])
-            current_step = context.user_data["test_steps"][context.user_data["test_index"]]
+    if st.waiting_time_input:
+        value = text
+        current_step = st.steps[st.index]
+        if not _valid_hhmm(value):
+            await update.message.reply_text(ERR["invalid_time"])
             await update.message.reply_text(current_step)
             return TEST_RUN
 
-        current_step = context.user_data["test_steps"][context.user_data["test_index"]]
-        if current_step == COPY["onboarding"]["screen_6"]:
-            await update.message.reply_text(COPY["onboarding"]["morning_saved"])
-        elif current_step == COPY["onboarding"]["screen_7"]:
-            await update.message.reply_text(COPY["onboarding"]["evening_saved"])
-
-        context.user_data["test_waiting_time_input"] = None
-        context.user_data["test_index"] += 1
-        await send_test_step(update.message, context)
-        steps = context.user_data["test_steps"]
-        idx = context.user_data["test_index"]
-        if idx >= len(steps) - 1:
+        if current_step == ONB["screen_6"]:
+            await update.message.reply_text(ONB["morning_saved"])
+        elif current_step == ONB["screen_7"]:
+            await update.message.reply_text(ONB["evening_saved"])
+
+        st.waiting_time_input = None
+        st.index += 1
+        await send_test_step(update.message, st)
+        if st.is_last_step():
             return ConversationHandler.END
         return TEST_RUN
 
-    if not context.user_data.get("test_waiting_reflection", False):
-        await update.message.reply_text(COPY["errors"]["wrong_input"])
+    if not st.waiting_reflection:
+        await update.message.reply_text(ERR["wrong_input"])
         return TEST_RUN
 
-    text = (update.message.text or "").strip()
     if len(text) > 500:
-        await update.message.reply_text(COPY["errors"]["reflection_too_long"])
-        await update.message.reply_text(COPY["onboarding"]["screen_3"])
+        await update.message.reply_text(ERR["reflection_too_long"])
+        await update.message.reply_text(ONB["screen_3"])
         return TEST_RUN
 
-    context.user_data["test_reflection_candidate"] = text
-    context.user_data["test_waiting_reflection"] = False
-    context.user_data["test_waiting_reflection_confirm"] = True
-    confirm_text = COPY["onboarding"]["reflection_confirm"].format(reflection_text=text)
-    kb = InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton(COPY["buttons"]["save"], callback_data="test:reflection:save")],
-            [InlineKeyboardButton(COPY["buttons"]["edit"], callback_data="test:reflection:edit")],
-        ]
-    )
-    await update.message.reply_text(confirm_text, reply_markup=kb)
+    st.reflection_candidate = text
+    st.waiting_reflection = False
+    st.waiting_reflection_confirm = True
+    confirm_text = reflection_confirm_text(text)
+    await update.message.reply_text(confirm_text, reply_markup=_TEST_REFLECTION_CONFIRM_MARKUP)
     return TEST_RUN
 
 
-async def test_reflection_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+@_with_test_state
+async def test_reflection_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, st: TestState) -> int:
     query = update.callback_query
     await query.answer()
-    if not context.user_data.get("test_waiting_reflection_confirm", False):
+    if not st.waiting_reflection_confirm:
         return TEST_RUN
 
     action = query.data.split(":")[-1]
     if action == "edit":
-        context.user_data["test_waiting_reflection"] = True
-        context.user_data["test_waiting_reflection_confirm"] = False
-        await query.message.reply_text(COPY["onboarding"]["screen_3"])
+        st.waiting_reflection = True
+        st.waiting_reflection_confirm = False
+        await query.message.reply_text(ONB["screen_3"])
         return TEST_RUN
 
-    context.user_data["test_reflection_text"] = context.user_data.get("test_reflection_candidate", "").strip()
-    context.user_data["test_waiting_reflection"] = False
-    context.user_data["test_waiting_reflection_confirm"] = False
-    await query.message.reply_text(COPY["onboarding"]["reflection_saved"])
-    context.user_data["test_index"] += 1
-    await send_test_step(query.message, context)
-    steps = context.user_data["test_steps"]
-    idx = context.user_data["test_index"]
-    if idx >= len(steps) - 1:
+    st.reflection_text = (st.reflection_candidate or "").strip()
+    st.waiting_reflection = False
+    st.waiting_reflection_confirm = False
+    await query.message.reply_text(ONB["reflection_saved"])
+    st.index += 1
+    await send_test_step(query.message, st)
+    if st.is_last_step():
         return ConversationHandler.END
     return TEST_RUN
 
 
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates from different chats concurrently, one at a time per chat.
+
+    Conversation and test state are keyed by chat and user, so updates within
+    a chat must not overlap; a slow reply in one chat no longer holds up the
+    rest.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_users: dict[int, int] = {}
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await coroutine
+            return
+        chat_id = chat.id
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._chat_users[chat_id] = self._chat_users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                try:
+                    await coroutine
+                finally:
+                    # Replies a handler left in flight go out before the
+                    # chat's next update is handled.
+                    await drain_pending_replies(chat_id)
+        finally:
+            remaining = self._chat_users[chat_id] - 1
+            if remaining:
+                self._chat_users[chat_id] = remaining
+            else:
+                del self._chat_users[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        return
+
+    async def shutdown(self) -> None:
+        return
+
+
+async def text_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Plain text outside the conversations: menu buttons first, then the
+    # evening answer. Substring checks keep the old Regex filter semantics.
+    text = update.message.text or ""
+    if "Пауза" in text:
+        await pause_handler(update, context)
+    elif "Возобнов" in text:
+        await resume_handler(update, context)
+    else:
+        await evening_status_handler(update, context)
+
+
+_THANKS_CALLBACKS = {
+    "presence:thanks": thanks_callback,
+    "final:thanks": final_thanks_callback,
+    "test:final:thanks": test_final_thanks_callback,
+}
+_THANKS_PATTERN = re.compile(r"^(?:presence|final|test:final):thanks$")
+
+
+async def thanks_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # One registered handler for all thanks buttons; the exact data picks the callback.
+    await _THANKS_CALLBACKS[update.callback_query.data](update, context)
+
+
 def build_app(token: str) -> Application:
     persistence = DbPersistence(DB_PATH)
-    app = Application.builder().token(token).persistence(persistence).build()
+    app = (
+        Application.builder()
+        .token(token)
+        .persistence(persistence)
+        .concurrent_updates(PerChatUpdateProcessor(max(CONCURRENT_UPDATES, 1)))
+        .http_version("2")
+        .build()
+    )
 
     onboarding_conv = ConversationHandler(
         entry_points=[
@@ -1590,13 +1810,9 @@ def build_app(token: str) -> Application:
     app.add_handler(change_time_conv)
     app.add_handler(CommandHandler("admin_stats", admin_stats_cmd))
     app.add_handler(CommandHandler("admin_nudge_onboarding", admin_nudge_onboarding_cmd))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"Пауза"), pause_handler))
-    app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"Возобнов"), resume_handler))
-    app.add_handler(CallbackQueryHandler(thanks_callback, pattern=r"^presence:thanks$"))
-    app.add_handler(CallbackQueryHandler(final_thanks_callback, pattern=r"^final:thanks$"))
-    app.add_handler(CallbackQueryHandler(test_final_thanks_callback, pattern=r"^test:final:thanks$"))
+    app.add_handler(CallbackQueryHandler(thanks_router, pattern=_THANKS_PATTERN))
     app.add_handler(MessageHandler(filters.COMMAND, unknown_command_handler))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, evening_status_handler))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_router))
 
     return app
 
@@ -1608,7 +1824,7 @@ def main() -> None:
 
     db.init_db(DB_PATH)
     app = build_app(token)
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
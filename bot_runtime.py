@@ -0,0 +1,71 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+import db
+from bot import DB_PATH, build_app, drain_pending_replies
+
+LOGGER = logging.getLogger(__name__)
+
+# Answer Telegram before the handlers finish. Off by default: a serverless
+# instance may be frozen right after the response is sent.
+_BACKGROUND_UPDATES = os.getenv("WEBHOOK_BACKGROUND_UPDATES", "").strip() == "1"
+_INFLIGHT = threading.BoundedSemaphore(int(os.getenv("WEBHOOK_MAX_INFLIGHT", "16")))
+
+_INIT_LOCK = threading.Lock()
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="tg-loop", daemon=True).start()
+atexit.register(_LOOP.call_soon_threadsafe, _LOOP.stop)
+_TG_APP = None
+
+
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+
+def ensure_tg_app():
+    global _TG_APP
+    if _TG_APP is not None:
+        return _TG_APP
+
+    token = os.getenv("BOT_TOKEN")
+    if not token:
+        raise RuntimeError("BOT_TOKEN is required")
+
+    with _INIT_LOCK:
+        if _TG_APP is None:
+            db.init_db(DB_PATH)
+            tg_app = build_app(token)
+            run_sync(tg_app.initialize())
+            _TG_APP = tg_app
+    return _TG_APP
+
+
+def _on_update_done(future) -> None:
+    _INFLIGHT.release()
+    if not future.cancelled() and future.exception() is not None:
+        LOGGER.error("background update failed", exc_info=future.exception())
+
+
+async def _process_and_drain(tg_app, update) -> None:
+    # Handlers may leave their last reply in flight, and persistence only
+    # writes in batches; finish both before the request returns and the
+    # instance can be frozen.
+    try:
+        # Same per-chat ordering as under polling when background updates
+        # overlap.
+        await tg_app.update_processor.process_update(update, tg_app.process_update(update))
+    finally:
+        await drain_pending_replies()
+        await tg_app.update_persistence()
+        await tg_app.persistence.flush()
+
+
+def process_update(tg_app, update) -> None:
+    if not _BACKGROUND_UPDATES or not _INFLIGHT.acquire(blocking=False):
+        run_sync(_process_and_drain(tg_app, update))
+        return
+    future = asyncio.run_coroutine_threadsafe(_process_and_drain(tg_app, update), _LOOP)
+    future.add_done_callback(_on_update_done)
@@ -1,4 +1,7 @@
+import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 from datetime import date, datetime, timedelta
 from typing import Any
@@ -10,6 +13,29 @@ except Exception:  # pragma: no cover - optional in local sqlite-only runs
     psycopg = None
     dict_row = None
 
+try:
+    from psycopg_pool import ConnectionPool
+except Exception:  # pragma: no cover - optional in local sqlite-only runs
+    ConnectionPool = None
+
+PG_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Server-side prepared statements do not survive a transaction pooler such as
+# Supabase's on port 6543, so they are off unless a direct or session-mode
+# connection opts in. psycopg then prepares a query after this many runs on a
+# connection and keeps the statement per connection.
+PG_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "0")) or None
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "15"))
+USER_CACHE_SIZE = 10000
+
+# (db_path, user_id) -> (expires_at, row). Per process only, so the TTL is the
+# bound on how stale a row written by another instance can be here.
+_user_cache: dict[tuple[str, int], tuple[float, dict[str, Any] | None]] = {}
+# Bumped on every invalidation. A read only caches its row if no invalidation
+# happened while it was in flight, so a read that raced a write on another
+# thread cannot put the pre-write row back.
+_user_cache_gen = 0
+_user_cache_lock = threading.Lock()
+
 
 def _is_postgres(db_path: str) -> bool:
     return db_path.startswith("postgres://") or db_path.startswith("postgresql://")
@@ -26,22 +52,77 @@ def get_conn(db_path: str):
     if _is_postgres(db_path):
         if psycopg is None:
             raise RuntimeError("psycopg is required for Postgres DB_PATH")
-        conn = psycopg.connect(db_path, row_factory=dict_row)
-        try:
+        if ConnectionPool is None:
+            conn = psycopg.connect(db_path, row_factory=dict_row)
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+            return
+        # The pool commits on success and rolls back on error.
+        with _pg_pool(db_path).connection() as conn:
             yield conn
-            conn.commit()
-        finally:
-            conn.close()
         return
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = lambda cursor, row: {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
-    conn.execute("PRAGMA foreign_keys = ON")
+    conn = _sqlite_conn(db_path)
     try:
         yield conn
         conn.commit()
-    finally:
-        conn.close()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# One SQLite connection per thread and path, kept open for the process
+# lifetime so its page and statement caches survive between calls.
+_local = threading.local()
+
+
+_pg_pools: dict[str, Any] = {}
+_pg_pools_lock = threading.Lock()
+
+
+def _pg_pool(db_path: str):
+    pool = _pg_pools.get(db_path)
+    if pool is not None:
+        return pool
+    with _pg_pools_lock:
+        pool = _pg_pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(
+                db_path,
+                min_size=1,
+                max_size=max(PG_POOL_SIZE, 1),
+                kwargs={"row_factory": dict_row, "prepare_threshold": PG_PREPARE_THRESHOLD},
+                # A warm serverless instance may hold connections the server
+                # has already dropped; check before handing one out.
+                check=ConnectionPool.check_connection,
+                open=True,
+            )
+            _pg_pools[db_path] = pool
+    return pool
+
+
+def _sqlite_conn(db_path: str) -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=5.0)
+        conn.row_factory = lambda cursor, row: {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+        conn.execute("PRAGMA foreign_keys = ON")
+        if db_path != ":memory:":
+            # WAL lets the bot and worker read while the other writes, and with
+            # synchronous=NORMAL a commit costs one fsync only at checkpoints.
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -20000")
+        conns[db_path] = conn
+    return conn
 
 
 def init_db(db_path: str) -> None:
@@ -107,6 +188,26 @@ def init_db(db_path: str) -> None:
                     state_json TEXT NOT NULL
                 )
                 """,
+                """
+                CREATE TABLE IF NOT EXISTS ptb_user_data (
+                    user_id BIGINT PRIMARY KEY,
+                    data_json TEXT NOT NULL
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS ptb_chat_data (
+                    chat_id BIGINT PRIMARY KEY,
+                    data_json TEXT NOT NULL
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS ptb_conversations (
+                    name TEXT NOT NULL,
+                    conv_key TEXT NOT NULL,
+                    state_json TEXT NOT NULL,
+                    PRIMARY KEY (name, conv_key)
+                )
+                """,
             ]
             for stmt in statements:
                 conn.execute(stmt)
@@ -165,47 +266,93 @@ def init_db(db_path: str) -> None:
                     state_key TEXT PRIMARY KEY,
                     state_json TEXT NOT NULL
                 );
+
+                CREATE TABLE IF NOT EXISTS ptb_user_data (
+                    user_id INTEGER PRIMARY KEY,
+                    data_json TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS ptb_chat_data (
+                    chat_id INTEGER PRIMARY KEY,
+                    data_json TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS ptb_conversations (
+                    name TEXT NOT NULL,
+                    conv_key TEXT NOT NULL,
+                    state_json TEXT NOT NULL,
+                    PRIMARY KEY (name, conv_key)
+                );
                 """
             )
 
 
+def _forget_user(db_path: str, user_id: int) -> None:
+    global _user_cache_gen
+    with _user_cache_lock:
+        _user_cache_gen += 1
+        _user_cache.pop((db_path, user_id), None)
+
+
 def get_user(db_path: str, user_id: int) -> dict[str, Any] | None:
+    key = (db_path, user_id)
+    cached = _user_cache.get(key)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        return dict(cached[1]) if cached[1] is not None else None
+    gen = _user_cache_gen
     with get_conn(db_path) as conn:
-        return conn.execute(_sql(db_path, "SELECT * FROM users WHERE user_id = ?"), (user_id,)).fetchone()
+        row = conn.execute(_sql(db_path, "SELECT * FROM users WHERE user_id = ?"), (user_id,)).fetchone()
+    if USER_CACHE_TTL > 0:
+        with _user_cache_lock:
+            if gen == _user_cache_gen:
+                if len(_user_cache) >= USER_CACHE_SIZE:
+                    # Dicts keep insertion order, so this drops the oldest entry.
+                    _user_cache.pop(next(iter(_user_cache)), None)
+                _user_cache[key] = (now + USER_CACHE_TTL, dict(row) if row is not None else None)
+    return row
+
+
+def _upsert_user(conn, db_path: str, user_id: int, fields: dict[str, Any]) -> None:
+    # New rows take the column defaults for anything not passed; existing rows
+    # only have the passed fields overwritten.
+    cols = ["user_id", *fields.keys()]
+    placeholders = ", ".join("?" for _ in cols)
+    if fields:
+        conflict = "DO UPDATE SET " + ", ".join(f"{k} = excluded.{k}" for k in fields)
+    else:
+        conflict = "DO NOTHING"
+    conn.execute(
+        _sql(
+            db_path,
+            f"INSERT INTO users ({', '.join(cols)}) VALUES ({placeholders}) ON CONFLICT (user_id) {conflict}",
+        ),
+        [user_id, *fields.values()],
+    )
 
 
 def upsert_user(db_path: str, user_id: int, **fields: Any) -> None:
     with get_conn(db_path) as conn:
-        exists = conn.execute(_sql(db_path, "SELECT 1 FROM users WHERE user_id = ?"), (user_id,)).fetchone()
-        if exists:
-            keys = list(fields.keys())
-            if not keys:
-                return
-            set_clause = ", ".join(f"{k} = ?" for k in keys)
-            values = [fields[k] for k in keys]
-            values.append(user_id)
-            conn.execute(_sql(db_path, f"UPDATE users SET {set_clause} WHERE user_id = ?"), values)
-        else:
-            payload = {
-                "user_id": user_id,
-                "timezone": None,
-                "morning_time": None,
-                "evening_time": None,
-                "morning_time_effective_from": None,
-                "evening_time_effective_from": None,
-                "paused": 0,
-                "onboarding_complete": 0,
-                "start_date": None,
-                "reflection_text": None,
-                "reflection_skipped": 0,
-            }
-            payload.update(fields)
-            cols = ", ".join(payload.keys())
-            placeholders = ", ".join("?" for _ in payload)
-            conn.execute(
-                _sql(db_path, f"INSERT INTO users ({cols}) VALUES ({placeholders})"),
-                list(payload.values()),
-            )
+        _upsert_user(conn, db_path, user_id, fields)
+    # Dropped after commit; see _user_cache_gen for reads already in flight.
+    _forget_user(db_path, user_id)
+
+
+def finish_onboarding(
+    db_path: str,
+    user_id: int,
+    local_date: date | None,
+    start_date: date,
+    **fields: Any,
+) -> dict[str, Any]:
+    # User row, today's day row and the read-back share one transaction.
+    with get_conn(db_path) as conn:
+        _upsert_user(conn, db_path, user_id, fields)
+        if local_date is not None:
+            _ensure_day_row(conn, db_path, user_id, local_date, start_date)
+        user = conn.execute(_sql(db_path, "SELECT * FROM users WHERE user_id = ?"), (user_id,)).fetchone()
+    _forget_user(db_path, user_id)
+    return user
 
 
 def list_active_users(db_path: str) -> list[dict[str, Any]]:
@@ -216,6 +363,32 @@ def list_active_users(db_path: str) -> list[dict[str, Any]]:
     return rows
 
 
+def list_scheduler_users(db_path: str) -> list[dict[str, Any]]:
+    """Active users plus how many time changes each has queued, in one query."""
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            """
+            SELECT u.*, COALESCE(p.pending_changes, 0) AS pending_changes
+            FROM users u
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS pending_changes
+                FROM pending_time_changes
+                GROUP BY user_id
+            ) p ON p.user_id = u.user_id
+            WHERE u.onboarding_complete = 1
+            """
+        ).fetchall()
+    return rows
+
+
+def list_onboarding_incomplete_users(db_path: str) -> list[dict[str, Any]]:
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            "SELECT user_id FROM users WHERE onboarding_complete = 0"
+        ).fetchall()
+    return rows
+
+
 def record_sent_message(db_path: str, user_id: int, local_date: date, message_type: str) -> bool:
     with get_conn(db_path) as conn:
         cur = conn.execute(
@@ -232,6 +405,42 @@ def record_sent_message(db_path: str, user_id: int, local_date: date, message_ty
         return bool(getattr(cur, "rowcount", 0) == 1)
 
 
+def claim_sent_messages(db_path: str, user_id: int, local_date: date, message_types: list[str]) -> set[str]:
+    """Record the markers in one statement; returns the ones this call inserted."""
+    if not message_types:
+        return set()
+    day = local_date.isoformat()
+    values = ", ".join("(?, ?, ?)" for _ in message_types)
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            _sql(
+                db_path,
+                f"""
+                INSERT INTO sent_messages (user_id, local_date, message_type)
+                VALUES {values}
+                ON CONFLICT (user_id, local_date, message_type) DO NOTHING
+                RETURNING message_type
+                """,
+            ),
+            [value for message_type in message_types for value in (user_id, day, message_type)],
+        ).fetchall()
+    return {row["message_type"] for row in rows}
+
+
+def release_sent_messages(db_path: str, user_id: int, local_date: date, message_types: list[str]) -> None:
+    if not message_types:
+        return
+    marks = ", ".join("?" for _ in message_types)
+    with get_conn(db_path) as conn:
+        conn.execute(
+            _sql(
+                db_path,
+                f"DELETE FROM sent_messages WHERE user_id = ? AND local_date = ? AND message_type IN ({marks})",
+            ),
+            [user_id, local_date.isoformat(), *message_types],
+        )
+
+
 def has_sent_message(db_path: str, user_id: int, local_date: date, message_type: str) -> bool:
     with get_conn(db_path) as conn:
         row = conn.execute(
@@ -241,6 +450,15 @@ def has_sent_message(db_path: str, user_id: int, local_date: date, message_type:
     return bool(row)
 
 
+def get_sent_messages(db_path: str, user_id: int, local_date: date) -> set[str]:
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            _sql(db_path, "SELECT message_type FROM sent_messages WHERE user_id = ? AND local_date = ?"),
+            (user_id, local_date.isoformat()),
+        ).fetchall()
+    return {row["message_type"] for row in rows}
+
+
 def get_day(db_path: str, user_id: int, local_date: date) -> dict[str, Any] | None:
     with get_conn(db_path) as conn:
         return conn.execute(
@@ -249,31 +467,94 @@ def get_day(db_path: str, user_id: int, local_date: date) -> dict[str, Any] | No
         ).fetchone()
 
 
-def ensure_day_row(db_path: str, user_id: int, local_date: date, start_date: date) -> dict[str, Any]:
-    existing = get_day(db_path, user_id, local_date)
-    if existing:
-        return existing
-    if local_date < start_date:
-        day_number = None
-    else:
-        with get_conn(db_path) as conn:
-            prev = conn.execute(
+_TICK_STATE_CHUNK = 500
+
+
+def load_tick_state(db_path: str, local_dates: dict[int, date]) -> dict[int, dict[str, Any]]:
+    """Today's and yesterday's day rows and today's sent markers for many users.
+
+    Two range reads per chunk of users replace the per-user lookups; rows
+    outside each user's own dates are dropped here.
+    """
+    state = {
+        user_id: {"local_date": local_date, "today": None, "yesterday": None, "sent": set()}
+        for user_id, local_date in local_dates.items()
+    }
+    user_ids = list(local_dates)
+    with get_conn(db_path) as conn:
+        for i in range(0, len(user_ids), _TICK_STATE_CHUNK):
+            chunk = user_ids[i : i + _TICK_STATE_CHUNK]
+            dates = [local_dates[user_id] for user_id in chunk]
+            first, last = min(dates), max(dates)
+            marks = ", ".join("?" for _ in chunk)
+            days = conn.execute(
+                _sql(db_path, f"SELECT * FROM days WHERE user_id IN ({marks}) AND local_date BETWEEN ? AND ?"),
+                [*chunk, (first - timedelta(days=1)).isoformat(), last.isoformat()],
+            ).fetchall()
+            for row in days:
+                entry = state[row["user_id"]]
+                if row["local_date"] == entry["local_date"].isoformat():
+                    entry["today"] = row
+                elif row["local_date"] == (entry["local_date"] - timedelta(days=1)).isoformat():
+                    entry["yesterday"] = row
+            sent = conn.execute(
                 _sql(
                     db_path,
-                    """
-                    SELECT COALESCE(MAX(day_number), 0) AS max_day
-                    FROM days
-                    WHERE user_id = ? AND local_date < ?
+                    f"""
+                    SELECT user_id, local_date, message_type FROM sent_messages
+                    WHERE user_id IN ({marks}) AND local_date BETWEEN ? AND ?
                     """,
                 ),
-                (user_id, local_date.isoformat()),
-            ).fetchone()
-            day_number = int(prev["max_day"]) + 1
-            conn.execute(
-                _sql(db_path, "INSERT INTO days (user_id, local_date, day_number, status) VALUES (?, ?, ?, NULL)"),
-                (user_id, local_date.isoformat(), day_number),
-            )
-    return get_day(db_path, user_id, local_date)
+                [*chunk, first.isoformat(), last.isoformat()],
+            ).fetchall()
+            for row in sent:
+                entry = state[row["user_id"]]
+                if row["local_date"] == entry["local_date"].isoformat():
+                    entry["sent"].add(row["message_type"])
+    return state
+
+
+def _ensure_day_row(conn, db_path: str, user_id: int, local_date: date, start_date: date) -> dict[str, Any] | None:
+    """Insert the day row if missing; returns it only when this call created it."""
+    if local_date < start_date:
+        return None
+    # Numbering and insert in one statement; an existing row is left alone.
+    # Day numbers grow with the date, so the latest earlier row is the maximum
+    # and a backwards walk of the (user_id, local_date) key finds it directly.
+    return conn.execute(
+        _sql(
+            db_path,
+            """
+            INSERT INTO days (user_id, local_date, day_number, status)
+            SELECT ?, ?, COALESCE(
+                (
+                    SELECT day_number FROM days
+                    WHERE user_id = ? AND local_date < ?
+                    ORDER BY local_date DESC
+                    LIMIT 1
+                ),
+                0
+            ) + 1, NULL
+            WHERE 1 = 1
+            ON CONFLICT (user_id, local_date) DO NOTHING
+            RETURNING *
+            """,
+        ),
+        (user_id, local_date.isoformat(), user_id, local_date.isoformat()),
+    ).fetchone()
+
+
+def ensure_day_row(db_path: str, user_id: int, local_date: date, start_date: date) -> dict[str, Any]:
+    select_day = _sql(db_path, "SELECT * FROM days WHERE user_id = ? AND local_date = ?")
+    params = (user_id, local_date.isoformat())
+    with get_conn(db_path) as conn:
+        row = conn.execute(select_day, params).fetchone()
+        if row or local_date < start_date:
+            return row
+        # Nothing comes back if a concurrent caller inserted the row first.
+        return _ensure_day_row(conn, db_path, user_id, local_date, start_date) or conn.execute(
+            select_day, params
+        ).fetchone()
 
 
 def set_day_status(db_path: str, user_id: int, local_date: date, status: str) -> None:
@@ -284,22 +565,52 @@ def set_day_status(db_path: str, user_id: int, local_date: date, status: str) ->
         )
 
 
-def can_update_evening_status(db_path: str, user_id: int, local_date: date, now_utc: datetime) -> bool:
-    with get_conn(db_path) as conn:
-        row = conn.execute(
-            _sql(db_path, "SELECT first_answered_at_utc FROM evening_answers WHERE user_id = ? AND local_date = ?"),
-            (user_id, local_date.isoformat()),
-        ).fetchone()
-        if row is None:
-            conn.execute(
-                _sql(db_path, "INSERT INTO evening_answers (user_id, local_date, first_answered_at_utc) VALUES (?, ?, ?)"),
-                (user_id, local_date.isoformat(), now_utc.isoformat()),
-            )
-            return True
+def _can_update_evening_status(conn, db_path: str, user_id: int, local_date: date, now_utc: datetime) -> bool:
+    # Records the first answer if there is none yet and returns whichever
+    # timestamp is stored; the no-op update makes RETURNING yield the
+    # existing row on conflict.
+    row = conn.execute(
+        _sql(
+            db_path,
+            """
+            INSERT INTO evening_answers (user_id, local_date, first_answered_at_utc)
+            VALUES (?, ?, ?)
+            ON CONFLICT (user_id, local_date)
+            DO UPDATE SET first_answered_at_utc = evening_answers.first_answered_at_utc
+            RETURNING first_answered_at_utc
+            """,
+        ),
+        (user_id, local_date.isoformat(), now_utc.isoformat()),
+    ).fetchone()
     first = datetime.fromisoformat(row["first_answered_at_utc"])
     return now_utc <= first + timedelta(minutes=10)
 
 
+def can_update_evening_status(db_path: str, user_id: int, local_date: date, now_utc: datetime) -> bool:
+    with get_conn(db_path) as conn:
+        return _can_update_evening_status(conn, db_path, user_id, local_date, now_utc)
+
+
+def save_evening_status(
+    db_path: str,
+    user_id: int,
+    local_date: date,
+    start_date: date,
+    status: str,
+    now_utc: datetime,
+) -> bool:
+    # Day row, edit-window check and the status update commit together.
+    with get_conn(db_path) as conn:
+        _ensure_day_row(conn, db_path, user_id, local_date, start_date)
+        if not _can_update_evening_status(conn, db_path, user_id, local_date, now_utc):
+            return False
+        conn.execute(
+            _sql(db_path, "UPDATE days SET status = ? WHERE user_id = ? AND local_date = ?"),
+            (status, user_id, local_date.isoformat()),
+        )
+    return True
+
+
 def get_evening_first_answer_time(db_path: str, user_id: int, local_date: date) -> datetime | None:
     with get_conn(db_path) as conn:
         row = conn.execute(
@@ -312,28 +623,25 @@ def get_evening_first_answer_time(db_path: str, user_id: int, local_date: date)
 
 
 def get_stats(db_path: str, user_id: int) -> dict[str, int]:
+    # One row per answered status, read off the (user_id, local_date) key.
     with get_conn(db_path) as conn:
         rows = conn.execute(
             _sql(
                 db_path,
                 """
-                SELECT
-                    SUM(CASE WHEN status IN ('full', 'partial', 'none') THEN 1 ELSE 0 END) AS total,
-                    SUM(CASE WHEN status = 'full' THEN 1 ELSE 0 END) AS full,
-                    SUM(CASE WHEN status = 'partial' THEN 1 ELSE 0 END) AS partial,
-                    SUM(CASE WHEN status = 'none' THEN 1 ELSE 0 END) AS none
+                SELECT status, COUNT(*) AS n
                 FROM days
-                WHERE user_id = ?
+                WHERE user_id = ? AND status IN ('full', 'partial', 'none')
+                GROUP BY status
                 """,
             ),
             (user_id,),
-        ).fetchone()
-    return {
-        "total": int(rows["total"] or 0),
-        "full": int(rows["full"] or 0),
-        "partial": int(rows["partial"] or 0),
-        "none": int(rows["none"] or 0),
-    }
+        ).fetchall()
+    stats = {"total": 0, "full": 0, "partial": 0, "none": 0}
+    for row in rows:
+        stats[row["status"]] = int(row["n"])
+        stats["total"] += int(row["n"])
+    return stats
 
 
 def get_admin_stats(db_path: str) -> dict[str, Any]:
@@ -432,7 +740,9 @@ def queue_time_change(
         )
 
 
-def apply_due_time_changes(db_path: str, user_id: int, local_date: date) -> None:
+def apply_due_time_changes(db_path: str, user_id: int, local_date: date) -> dict[str, Any] | None:
+    """Apply queued time changes that are due; returns the updated user row, or None if none were."""
+    user = None
     with get_conn(db_path) as conn:
         rows = conn.execute(
             _sql(
@@ -459,6 +769,11 @@ def apply_due_time_changes(db_path: str, user_id: int, local_date: date) -> None
                 _sql(db_path, "DELETE FROM pending_time_changes WHERE user_id = ? AND time_type = ?"),
                 (user_id, row["time_type"]),
             )
+        if rows:
+            user = conn.execute(_sql(db_path, "SELECT * FROM users WHERE user_id = ?"), (user_id,)).fetchone()
+    if rows:
+        _forget_user(db_path, user_id)
+    return user
 
 
 def get_pending_time_change(db_path: str, user_id: int, time_type: str) -> dict[str, Any] | None:
@@ -472,7 +787,15 @@ def get_pending_time_change(db_path: str, user_id: int, time_type: str) -> dict[
 def get_last_day_number(db_path: str, user_id: int) -> int:
     with get_conn(db_path) as conn:
         row = conn.execute(
-            _sql(db_path, "SELECT COALESCE(MAX(day_number), 0) AS n FROM days WHERE user_id = ?"),
+            _sql(
+                db_path,
+                """
+                SELECT COALESCE(
+                    (SELECT day_number FROM days WHERE user_id = ? ORDER BY local_date DESC LIMIT 1),
+                    0
+                ) AS n
+                """,
+            ),
             (user_id,),
         ).fetchone()
     return int(row["n"] or 0)
@@ -481,6 +804,7 @@ def get_last_day_number(db_path: str, user_id: int) -> int:
 def delete_user(db_path: str, user_id: int) -> None:
     with get_conn(db_path) as conn:
         conn.execute(_sql(db_path, "DELETE FROM users WHERE user_id = ?"), (user_id,))
+    _forget_user(db_path, user_id)
 
 
 def get_runtime_state(db_path: str, state_key: str) -> str | None:
@@ -494,6 +818,18 @@ def get_runtime_state(db_path: str, state_key: str) -> str | None:
     return row["state_json"]
 
 
+def get_runtime_states(db_path: str, state_keys: list[str]) -> dict[str, str]:
+    if not state_keys:
+        return {}
+    placeholders = ", ".join("?" for _ in state_keys)
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            _sql(db_path, f"SELECT state_key, state_json FROM runtime_state WHERE state_key IN ({placeholders})"),
+            tuple(state_keys),
+        ).fetchall()
+    return {row["state_key"]: row["state_json"] for row in rows}
+
+
 def set_runtime_state(db_path: str, state_key: str, state_json: str) -> None:
     with get_conn(db_path) as conn:
         conn.execute(
@@ -507,3 +843,85 @@ def set_runtime_state(db_path: str, state_key: str, state_json: str) -> None:
             ),
             (state_key, state_json),
         )
+
+
+def delete_runtime_state(db_path: str, state_key: str) -> None:
+    with get_conn(db_path) as conn:
+        conn.execute(_sql(db_path, "DELETE FROM runtime_state WHERE state_key = ?"), (state_key,))
+
+
+# PTB user_data / chat_data, one row per user or chat.
+_PTB_DATA_TABLES = {
+    "user": ("ptb_user_data", "user_id"),
+    "chat": ("ptb_chat_data", "chat_id"),
+}
+
+
+def get_ptb_data(db_path: str, kind: str) -> dict[int, str]:
+    table, id_col = _PTB_DATA_TABLES[kind]
+    with get_conn(db_path) as conn:
+        rows = conn.execute(f"SELECT {id_col} AS id, data_json FROM {table}").fetchall()
+    return {int(row["id"]): row["data_json"] for row in rows}
+
+
+def get_ptb_data_entry(db_path: str, kind: str, entry_id: int) -> str | None:
+    table, id_col = _PTB_DATA_TABLES[kind]
+    with get_conn(db_path) as conn:
+        row = conn.execute(
+            _sql(db_path, f"SELECT data_json FROM {table} WHERE {id_col} = ?"),
+            (entry_id,),
+        ).fetchone()
+    return row["data_json"] if row else None
+
+
+def save_ptb_data(db_path: str, kind: str, entries: dict[int, str | None]) -> None:
+    """Upsert the given rows and delete those mapped to None, in one transaction."""
+    table, id_col = _PTB_DATA_TABLES[kind]
+    upserts = [(entry_id, data) for entry_id, data in entries.items() if data is not None]
+    deletes = [(entry_id,) for entry_id, data in entries.items() if data is None]
+    with get_conn(db_path) as conn:
+        cur = conn.cursor()
+        if upserts:
+            cur.executemany(
+                _sql(
+                    db_path,
+                    f"""
+                    INSERT INTO {table} ({id_col}, data_json)
+                    VALUES (?, ?)
+                    ON CONFLICT({id_col}) DO UPDATE SET data_json = excluded.data_json
+                    """,
+                ),
+                upserts,
+            )
+        if deletes:
+            cur.executemany(_sql(db_path, f"DELETE FROM {table} WHERE {id_col} = ?"), deletes)
+
+
+def get_ptb_conversations(db_path: str, name: str) -> dict[str, str]:
+    with get_conn(db_path) as conn:
+        rows = conn.execute(
+            _sql(db_path, "SELECT conv_key, state_json FROM ptb_conversations WHERE name = ?"),
+            (name,),
+        ).fetchall()
+    return {row["conv_key"]: row["state_json"] for row in rows}
+
+
+def save_ptb_conversations(db_path: str, name: str, entries: dict[str, str | None]) -> None:
+    upserts = [(name, key, state) for key, state in entries.items() if state is not None]
+    deletes = [(name, key) for key, state in entries.items() if state is None]
+    with get_conn(db_path) as conn:
+        cur = conn.cursor()
+        if upserts:
+            cur.executemany(
+                _sql(
+                    db_path,
+                    """
+                    INSERT INTO ptb_conversations (name, conv_key, state_json)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(name, conv_key) DO UPDATE SET state_json = excluded.state_json
+                    """,
+                ),
+                upserts,
+            )
+        if deletes:
+            cur.executemany(_sql(db_path, "DELETE FROM ptb_conversations WHERE name = ? AND conv_key = ?"), deletes)
@@ -0,0 +1,41 @@
+import functools
+
+import orjson
+from telegram import MessageEntity
+
+with open("texts/copy.ru.json", "rb") as f:
+    COPY = orjson.loads(f.read())
+with open("texts/quotes.json", "rb") as f:
+    QUOTES = orjson.loads(f.read())
+with open("texts/presence_lines.json", "rb") as f:
+    PRESENCE = orjson.loads(f.read())
+
+MORNING = COPY["morning"]
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def quote_message(quote: str) -> tuple[str, tuple[MessageEntity, ...]]:
+    # The quote is sent as plain text with an italic entity instead of HTML;
+    # entity offsets are counted in UTF-16 code units.
+    prefix, suffix = MORNING["quote_message"].split("{quote}", 1)
+    text = f"{prefix}{quote}{suffix}"
+    length = _utf16_len(quote)
+    if not length:
+        return text, ()
+    return text, (MessageEntity(MessageEntity.ITALIC, _utf16_len(prefix), length),)
+
+
+# Quotes are fixed, so every morning quote message is built up front.
+QUOTE_MESSAGES = tuple(quote_message(q) for q in QUOTES)
+QUOTE_FALLBACK = quote_message("—")
+QUOTE_PREFIX = MORNING["quote_message"].split("{quote}", 1)[0]
+
+
+# Only a few dozen (day, days left) pairs ever occur, and they are the same
+# for everyone on a given date.
+@functools.lru_cache(maxsize=256)
+def morning_base_text(day_number: int, days_left: int) -> str:
+    return MORNING["base"].format(day_number=day_number, days_left=days_left)
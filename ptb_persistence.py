@@ -1,106 +1,196 @@
-import json
+import asyncio
+import copy
 from typing import Any
 
+import orjson
 from telegram.ext import BasePersistence, PersistenceInput
 
 import db
 
+# Marks an entry that should be deleted on the next flush.
+_DROP = object()
+
+
+def _dumps(value: Any) -> str:
+    # Non-string dict keys are written as strings, as the json module did.
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _loads(raw: str | None, default: Any = None):
+    if not raw:
+        return default
+    try:
+        return orjson.loads(raw)
+    except Exception:
+        return default
+
 
 class DbPersistence(BasePersistence):
-    def __init__(self, db_path: str):
+    """Stores user_data, chat_data and conversations as one row per entry.
+
+    update_* only record entries that differ from what is stored; flush()
+    writes them in one transaction per table. bot_data and callback_data stay
+    single runtime_state blobs.
+    """
+
+    def __init__(self, db_path: str, update_interval: float = 30):
         super().__init__(
             store_data=PersistenceInput(user_data=True, chat_data=True, bot_data=True, callback_data=True),
-            update_interval=0,
+            update_interval=update_interval,
         )
         self.db_path = db_path
+        # Parsed copies of what is in the database, never handed out to PTB.
+        self._stored: dict[str, Any] = {"user": {}, "chat": {}}
+        self._pending: dict[str, dict[Any, Any]] = {}
+        self._pending_convs: dict[str, dict[str, Any]] = {}
+        self._replaced: dict[str, Any] = {}
+        self._flush_task: asyncio.Task | None = None
 
     def _load_json(self, key: str, default: Any):
-        raw = db.get_runtime_state(self.db_path, key)
-        if not raw:
-            return default
-        try:
-            return json.loads(raw)
-        except Exception:
-            return default
+        return _loads(db.get_runtime_state(self.db_path, key), default)
 
     def _save_json(self, key: str, value: Any) -> None:
-        db.set_runtime_state(self.db_path, key, json.dumps(value, ensure_ascii=False))
+        raw = _dumps(value)
+        db.set_runtime_state(self.db_path, key, raw)
+        self._stored[key] = orjson.loads(raw)
+
+    def _load_data(self, kind: str) -> dict[int, Any]:
+        rows = db.get_ptb_data(self.db_path, kind)
+        if not rows:
+            rows = self._migrate_blob(kind)
+        stored = {entry_id: _loads(raw, {}) for entry_id, raw in rows.items()}
+        self._stored[kind] = stored
+        return {entry_id: copy.deepcopy(data) for entry_id, data in stored.items()}
+
+    def _migrate_blob(self, kind: str) -> dict[int, str]:
+        # Older deployments kept all entries in one runtime_state blob.
+        legacy = self._load_json(f"{kind}_data", None)
+        if not isinstance(legacy, dict) or not legacy:
+            return {}
+        rows = {int(k): _dumps(v) for k, v in legacy.items()}
+        db.save_ptb_data(self.db_path, kind, rows)
+        db.delete_runtime_state(self.db_path, f"{kind}_data")
+        return rows
+
+    def _refresh_entry(self, kind: str, entry_id: int, target: dict[Any, Any]) -> None:
+        # Only overwrite local data if the row moved on since we last read or
+        # wrote it, so changes that are not flushed yet are kept.
+        latest = _loads(db.get_ptb_data_entry(self.db_path, kind, entry_id))
+        if latest is None or latest == self._stored[kind].get(entry_id):
+            return
+        self._stored[kind][entry_id] = latest
+        target.clear()
+        target.update(copy.deepcopy(latest))
+
+    def _mark(self, kind: str, entry_id: int, data: Any) -> None:
+        # PTB reports every entry an update touched, read-only or not; entries
+        # still equal to what is stored need no write.
+        stored = self._stored[kind]
+        if data is _DROP:
+            unchanged = entry_id not in stored
+        else:
+            unchanged = stored.get(entry_id) == data
+        if unchanged:
+            self._pending.get(kind, {}).pop(entry_id, None)
+            return
+        self._pending.setdefault(kind, {})[entry_id] = data
+        self._schedule_flush()
+
+    def _replace(self, key: str, value: Any) -> None:
+        if self._stored.get(key) == value:
+            self._replaced.pop(key, None)
+            return
+        self._replaced[key] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        # PTB calls update_* for every touched user and chat in one batch; a
+        # single flush queued behind them writes each table once.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
 
     async def get_user_data(self) -> dict[int, dict[Any, Any]]:
-        data = self._load_json("user_data", {})
-        return {int(k): v for k, v in data.items()}
+        return self._load_data("user")
 
     async def get_chat_data(self) -> dict[int, dict[Any, Any]]:
-        data = self._load_json("chat_data", {})
-        return {int(k): v for k, v in data.items()}
+        return self._load_data("chat")
 
     async def get_bot_data(self) -> dict[Any, Any]:
-        return self._load_json("bot_data", {})
+        self._stored["bot_data"] = self._load_json("bot_data", {})
+        return copy.deepcopy(self._stored["bot_data"])
 
     async def get_callback_data(self):
-        return self._load_json("callback_data", None)
+        self._stored["callback_data"] = self._load_json("callback_data", None)
+        return copy.deepcopy(self._stored["callback_data"])
 
     async def get_conversations(self, name: str):
-        items = self._load_json(f"conv:{name}", [])
-        out: dict[tuple[int | str, ...], object] = {}
-        for item in items:
-            try:
-                out[tuple(item["key"])] = item["state"]
-            except Exception:
-                continue
-        return out
+        rows = db.get_ptb_conversations(self.db_path, name)
+        if not rows:
+            # Same migration as for user/chat data.
+            legacy = self._load_json(f"conv:{name}", [])
+            for item in legacy if isinstance(legacy, list) else []:
+                try:
+                    rows[_dumps(list(item["key"]))] = _dumps(item["state"])
+                except Exception:
+                    continue
+            if rows:
+                db.save_ptb_conversations(self.db_path, name, rows)
+                db.delete_runtime_state(self.db_path, f"conv:{name}")
+        return {tuple(orjson.loads(key)): _loads(state) for key, state in rows.items()}
 
     async def update_conversation(self, name: str, key: tuple[int | str, ...], new_state: object | None) -> None:
-        current = await self.get_conversations(name)
-        if new_state is None:
-            current.pop(tuple(key), None)
-        else:
-            current[tuple(key)] = new_state
-        payload = [{"key": list(k), "state": v} for k, v in current.items()]
-        self._save_json(f"conv:{name}", payload)
+        self._pending_convs.setdefault(name, {})[_dumps(list(key))] = _DROP if new_state is None else new_state
+        self._schedule_flush()
 
     async def update_user_data(self, user_id: int, data: dict[Any, Any]) -> None:
-        current = self._load_json("user_data", {})
-        current[str(user_id)] = data
-        self._save_json("user_data", current)
+        self._mark("user", user_id, data)
 
     async def update_chat_data(self, chat_id: int, data: dict[Any, Any]) -> None:
-        current = self._load_json("chat_data", {})
-        current[str(chat_id)] = data
-        self._save_json("chat_data", current)
+        self._mark("chat", chat_id, data)
 
     async def update_bot_data(self, data: dict[Any, Any]) -> None:
-        self._save_json("bot_data", data)
+        self._replace("bot_data", data)
 
     async def update_callback_data(self, data) -> None:
-        self._save_json("callback_data", data)
+        self._replace("callback_data", data)
 
     async def drop_chat_data(self, chat_id: int) -> None:
-        current = self._load_json("chat_data", {})
-        current.pop(str(chat_id), None)
-        self._save_json("chat_data", current)
+        self._mark("chat", chat_id, _DROP)
 
     async def drop_user_data(self, user_id: int) -> None:
-        current = self._load_json("user_data", {})
-        current.pop(str(user_id), None)
-        self._save_json("user_data", current)
+        self._mark("user", user_id, _DROP)
 
     async def refresh_user_data(self, user_id: int, user_data: dict[Any, Any]) -> None:
-        latest = (await self.get_user_data()).get(user_id)
-        if latest is not None:
-            user_data.clear()
-            user_data.update(latest)
+        self._refresh_entry("user", user_id, user_data)
 
     async def refresh_chat_data(self, chat_id: int, chat_data: dict[Any, Any]) -> None:
-        latest = (await self.get_chat_data()).get(chat_id)
-        if latest is not None:
-            chat_data.clear()
-            chat_data.update(latest)
+        self._refresh_entry("chat", chat_id, chat_data)
 
     async def refresh_bot_data(self, bot_data: dict[Any, Any]) -> None:
-        latest = await self.get_bot_data()
-        bot_data.clear()
-        bot_data.update(latest)
+        known = self._stored.get("bot_data")
+        latest = self._load_json("bot_data", {})
+        self._stored["bot_data"] = latest
+        if latest != known:
+            bot_data.clear()
+            bot_data.update(copy.deepcopy(latest))
 
     async def flush(self) -> None:
-        return
+        replaced, self._replaced = self._replaced, {}
+        for key, value in replaced.items():
+            self._save_json(key, value)
+
+        pending, self._pending = self._pending, {}
+        for kind, changes in pending.items():
+            rows = {entry_id: None if data is _DROP else _dumps(data) for entry_id, data in changes.items()}
+            db.save_ptb_data(self.db_path, kind, rows)
+            stored = self._stored[kind]
+            for entry_id, raw in rows.items():
+                if raw is None:
+                    stored.pop(entry_id, None)
+                else:
+                    stored[entry_id] = orjson.loads(raw)
+
+        convs, self._pending_convs = self._pending_convs, {}
+        for name, changes in convs.items():
+            rows = {key: None if state is _DROP else _dumps(state) for key, state in changes.items()}
+            db.save_ptb_conversations(self.db_path, name, rows)
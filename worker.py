@@ -1,14 +1,20 @@
 import asyncio
-import html
-import json
+import functools
 import logging
 import os
 from datetime import date, datetime, time, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram.request import HTTPXRequest
 
 import db
+from messages import COPY, PRESENCE, QUOTE_FALLBACK, QUOTE_MESSAGES, morning_base_text
+
+try:
+    import uvloop
+except Exception:  # pragma: no cover - optional event loop for the standalone worker
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
@@ -17,14 +23,22 @@ START_DATE = date(2026, 2, 18)
 END_DATE = date(2026, 4, 4)
 HALFWAY_DATE = date(2026, 3, 13)
 DB_PATH = os.getenv("DB_PATH") or os.getenv("DATABASE_URL", "bot.sqlite3")
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Longest sleep between ticks; the loop wakes sooner when a send is due.
 POLL_SECONDS = int(os.getenv("WORKER_POLL_SECONDS", "60"))
+TICK_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "16"))
+# Upper bound for the per-request override on the cron endpoint.
+TICK_CONCURRENCY_MAX = int(os.getenv("WORKER_CONCURRENCY_MAX", "64"))
+
+BUTTONS = COPY["buttons"]
+MORNING = COPY["morning"]
+EVENING = COPY["evening"]
+FINAL = COPY["final"]
+
 
-with open("texts/copy.ru.json", "r", encoding="utf-8") as f:
-    COPY = json.load(f)
-with open("texts/quotes.json", "r", encoding="utf-8") as f:
-    QUOTES = json.load(f)
-with open("texts/presence_lines.json", "r", encoding="utf-8") as f:
-    PRESENCE = json.load(f)
+@functools.lru_cache(maxsize=64)
+def _zi(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
 
 
 def parse_hhmm(value: str) -> tuple[int, int]:
@@ -32,85 +46,139 @@ def parse_hhmm(value: str) -> tuple[int, int]:
     return int(h), int(m)
 
 
-def due_by_now(local_now: datetime, hhmm: str) -> bool:
-    h, m = parse_hhmm(hhmm)
-    target = time(hour=h, minute=m)
-    return local_now.time().replace(second=0, microsecond=0) >= target
+# Only 1440 possible values; every user's times are parsed on every tick.
+@functools.lru_cache(maxsize=1440)
+def _hhmm_minutes(value: str) -> int:
+    h, m = parse_hhmm(value)
+    return h * 60 + m
+
+
+# Every date the worker sends for falls in the fixed campaign window.
+_DAYS_LEFT = {
+    START_DATE + timedelta(days=i): (END_DATE - START_DATE).days - i for i in range((END_DATE - START_DATE).days + 1)
+}
 
 
 def days_left(local_date: date) -> int:
-    return max((END_DATE - local_date).days, 0)
+    left = _DAYS_LEFT.get(local_date)
+    if left is None:
+        return max((END_DATE - local_date).days, 0)
+    return left
 
 
-def build_menu_rows(paused: bool) -> list[list[str]]:
+def _menu_rows(paused: bool) -> list[list[str]]:
     pause_key = "resume" if paused else "pause"
-    return [[COPY["buttons"]["time_change"]], [COPY["buttons"][pause_key]]]
+    return [[BUTTONS["time_change"]], [BUTTONS[pause_key]]]
+
+
+# Indexed by the paused flag; there are only two possible menus.
+_MENU_ROWS = (_menu_rows(False), _menu_rows(True))
+_MENU_MARKUPS = tuple(
+    ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=False) for rows in _MENU_ROWS
+)
+_EVENING_STATUS_MARKUPS = tuple(
+    ReplyKeyboardMarkup(
+        [
+            [BUTTONS["status_full"]],
+            [BUTTONS["status_partial"]],
+            [BUTTONS["status_none"]],
+        ]
+        + rows,
+        resize_keyboard=True,
+        one_time_keyboard=False,
+    )
+    for rows in _MENU_ROWS
+)
+
+
+_PRESENCE_THANKS_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(BUTTONS["thanks"], callback_data="presence:thanks")]]
+)
+_FINAL_THANKS_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(BUTTONS["thanks"], callback_data="final:thanks")]]
+)
+
+
+def build_menu_rows(paused: bool) -> list[list[str]]:
+    return _MENU_ROWS[paused]
 
 
 def menu_markup(user: dict) -> ReplyKeyboardMarkup:
-    paused = bool(int(user.get("paused", 0)) == 1)
-    return ReplyKeyboardMarkup(build_menu_rows(paused), resize_keyboard=True, one_time_keyboard=False)
+    return _MENU_MARKUPS[int(user.get("paused", 0)) == 1]
 
 
 def evening_status_markup(user: dict) -> ReplyKeyboardMarkup:
-    rows = [
-        [COPY["buttons"]["status_full"]],
-        [COPY["buttons"]["status_partial"]],
-        [COPY["buttons"]["status_none"]],
-    ] + build_menu_rows(bool(int(user.get("paused", 0)) == 1))
-    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=False)
+    return _EVENING_STATUS_MARKUPS[int(user.get("paused", 0)) == 1]
 
 
-async def send_morning(bot: Bot, user: dict, local_date: date) -> None:
+async def send_once(bot: Bot, user: dict, local_date: date, sent: set[str], message_type: str, **kwargs) -> bool:
+    # The marker is claimed before sending, so overlapping ticks or the bot's
+    # onboarding catch-up cannot send the same message twice; a failed send
+    # releases it for the next tick.
     user_id = user["user_id"]
-
-    start_date = date.fromisoformat(user["start_date"])
-    today_row = db.ensure_day_row(DB_PATH, user_id, local_date, start_date)
+    if message_type in sent or not db.record_sent_message(DB_PATH, user_id, local_date, message_type):
+        return False
+    try:
+        await bot.send_message(chat_id=user_id, **kwargs)
+    except Exception:
+        db.release_sent_messages(DB_PATH, user_id, local_date, [message_type])
+        raise
+    sent.add(message_type)
+    return True
+
+
+async def send_morning(
+    bot: Bot,
+    user: dict,
+    local_date: date,
+    today_row: dict,
+    yesterday_row: dict | None,
+    sent: set[str],
+) -> None:
     day_number = int(today_row["day_number"])
 
     if local_date == END_DATE:
-        if not db.has_sent_message(DB_PATH, user_id, local_date, "morning_status"):
-            await bot.send_message(chat_id=user_id, text=COPY["morning"]["last_day"], reply_markup=menu_markup(user))
-            db.record_sent_message(DB_PATH, user_id, local_date, "morning_status")
+        await send_once(
+            bot,
+            user,
+            local_date,
+            sent,
+            "morning_status",
+            text=MORNING["last_day"],
+            reply_markup=menu_markup(user),
+        )
         return
 
-    status_text = COPY["morning"]["base"].format(
-        day_number=day_number,
-        days_left=days_left(local_date),
+    if "morning_status" not in sent:
+        status_text = morning_base_text(day_number, days_left(local_date))
+        if yesterday_row and yesterday_row.get("status") is None:
+            status_text = f"{MORNING['yesterday_missed']}\n\n{status_text}"
+        if local_date >= HALFWAY_DATE:
+            status_text = f"{status_text}\n\n{MORNING['halfway']}"
+        await send_once(bot, user, local_date, sent, "morning_status", text=status_text, reply_markup=menu_markup(user))
+
+    idx = day_number - 1
+    quote_text, quote_entities = QUOTE_MESSAGES[idx] if 0 <= idx < len(QUOTE_MESSAGES) else QUOTE_FALLBACK
+    await send_once(
+        bot,
+        user,
+        local_date,
+        sent,
+        "morning_quote",
+        text=quote_text,
+        reply_markup=menu_markup(user),
+        entities=quote_entities,
     )
-    y_row = db.get_day(DB_PATH, user_id, local_date - timedelta(days=1))
-    if y_row and y_row.get("status") is None:
-        status_text = f"{COPY['morning']['yesterday_missed']}\n\n{status_text}"
-    if local_date >= HALFWAY_DATE:
-        status_text = f"{status_text}\n\n{COPY['morning']['halfway']}"
-
-    if not db.has_sent_message(DB_PATH, user_id, local_date, "morning_status"):
-        await bot.send_message(chat_id=user_id, text=status_text, reply_markup=menu_markup(user))
-        db.record_sent_message(DB_PATH, user_id, local_date, "morning_status")
-
-    if not db.has_sent_message(DB_PATH, user_id, local_date, "morning_quote"):
-        idx = day_number - 1
-        quote = QUOTES[idx] if 0 <= idx < len(QUOTES) else "—"
-        quote_text = COPY["morning"]["quote_message"].format(quote=f"<i>{html.escape(quote)}</i>")
-        await bot.send_message(
-            chat_id=user_id,
-            text=quote_text,
-            reply_markup=menu_markup(user),
-            parse_mode="HTML",
-        )
-        db.record_sent_message(DB_PATH, user_id, local_date, "morning_quote")
 
 
-async def send_presence(bot: Bot, user: dict, local_date: date) -> None:
-    user_id = user["user_id"]
-    if db.has_sent_message(DB_PATH, user_id, local_date, "presence"):
+async def send_presence(bot: Bot, user: dict, local_date: date, today_row: dict, sent: set[str]) -> None:
+    if "presence" in sent:
         return
 
-    day_row = db.get_day(DB_PATH, user_id, local_date)
-    if not day_row or not day_row.get("day_number"):
+    if not today_row or not today_row.get("day_number"):
         return
 
-    day_number = int(day_row["day_number"])
+    day_number = int(today_row["day_number"])
     if day_number % 4 != 0 or day_number > 44:
         return
 
@@ -118,72 +186,74 @@ async def send_presence(bot: Bot, user: dict, local_date: date) -> None:
     if idx < 0 or idx >= len(PRESENCE):
         return
 
-    kb = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(COPY["buttons"]["thanks"], callback_data="presence:thanks")]]
-    )
-    await bot.send_message(chat_id=user_id, text=PRESENCE[idx], reply_markup=kb)
-    db.record_sent_message(DB_PATH, user_id, local_date, "presence")
+    await send_once(bot, user, local_date, sent, "presence", text=PRESENCE[idx], reply_markup=_PRESENCE_THANKS_MARKUP)
 
 
-async def send_evening_prompt(bot: Bot, user: dict, local_date: date) -> None:
-    user_id = user["user_id"]
-    if db.has_sent_message(DB_PATH, user_id, local_date, "evening_prompt"):
-        return
-
-    await bot.send_message(
-        chat_id=user_id,
-        text=COPY["evening"]["prompt"],
+async def send_evening_prompt(bot: Bot, user: dict, local_date: date, sent: set[str]) -> None:
+    await send_once(
+        bot,
+        user,
+        local_date,
+        sent,
+        "evening_prompt",
+        text=EVENING["prompt"],
         reply_markup=evening_status_markup(user),
     )
-    db.record_sent_message(DB_PATH, user_id, local_date, "evening_prompt")
-
 
-async def send_evening_reminder(bot: Bot, user: dict, local_date: date) -> None:
-    user_id = user["user_id"]
-    if db.has_sent_message(DB_PATH, user_id, local_date, "evening_reminder"):
-        return
 
-    row = db.get_day(DB_PATH, user_id, local_date)
-    if row and row.get("status") is not None:
+async def send_evening_reminder(bot: Bot, user: dict, local_date: date, today_row: dict, sent: set[str]) -> None:
+    if today_row and today_row.get("status") is not None:
         return
 
-    await bot.send_message(
-        chat_id=user_id,
-        text=COPY["evening"]["reminder"],
+    await send_once(
+        bot,
+        user,
+        local_date,
+        sent,
+        "evening_reminder",
+        text=EVENING["reminder"],
         reply_markup=evening_status_markup(user),
     )
-    db.record_sent_message(DB_PATH, user_id, local_date, "evening_reminder")
 
 
-async def send_final_summary(bot: Bot, user: dict, local_date: date) -> None:
-    user_id = user["user_id"]
+async def send_final_summary(bot: Bot, user: dict, local_date: date, sent: set[str]) -> None:
     if local_date != END_DATE:
         return
-    if db.has_sent_message(DB_PATH, user_id, local_date, "final_summary"):
+    if "final_summary" in sent:
         return
 
-    stats = db.get_stats(DB_PATH, user_id)
-    lines = [COPY["final"]["title"], COPY["final"]["stats"].format(**stats)]
+    stats = db.get_stats(DB_PATH, user["user_id"])
+    lines = [FINAL["title"], FINAL["stats"].format(**stats)]
     reflection = (user.get("reflection_text") or "").strip()
     if reflection:
-        lines.append(COPY["final"]["reflection"].format(reflection_text=reflection))
-        lines.append(COPY["final"]["reflection_invite"])
-    kb = InlineKeyboardMarkup(
-        [[InlineKeyboardButton(COPY["buttons"]["thanks"], callback_data="final:thanks")]]
+        lines.append(FINAL["reflection"].format(reflection_text=reflection))
+        lines.append(FINAL["reflection_invite"])
+    await send_once(
+        bot,
+        user,
+        local_date,
+        sent,
+        "final_summary",
+        text="\n\n".join(lines),
+        reply_markup=_FINAL_THANKS_MARKUP,
     )
-    await bot.send_message(chat_id=user_id, text="\n\n".join(lines), reply_markup=kb)
-    db.record_sent_message(DB_PATH, user_id, local_date, "final_summary")
 
 
-async def process_user(bot: Bot, user: dict) -> None:
+async def process_user(
+    bot: Bot,
+    user: dict,
+    state: dict | None = None,
+    local_now: datetime | None = None,
+) -> None:
     user_id = user["user_id"]
-    tz = ZoneInfo(user["timezone"])
-    now_utc = datetime.now(timezone.utc)
-    local_now = now_utc.astimezone(tz)
+    if local_now is None:
+        local_now = datetime.now(timezone.utc).astimezone(_zi(user["timezone"]))
     local_date = local_now.date()
 
-    db.apply_due_time_changes(DB_PATH, user_id, local_date)
-    user = db.get_user(DB_PATH, user_id)
+    # The tick's user list says whether anything is queued; the row only
+    # changes if one of those changes is due today.
+    if user.get("pending_changes", 1):
+        user = db.apply_due_time_changes(DB_PATH, user_id, local_date) or user
 
     if int(user["paused"]) == 1:
         return
@@ -194,56 +264,178 @@ async def process_user(bot: Bot, user: dict) -> None:
     if local_date > END_DATE:
         return
 
-    db.ensure_day_row(DB_PATH, user_id, local_date, start_date)
+    # run_tick_once prefetches the day rows and markers for all users at the
+    # tick's local time; a direct call reads them here.
+    if state is None or state["local_date"] != local_date:
+        state = db.load_tick_state(DB_PATH, {user_id: local_date})[user_id]
+    today_row = state["today"] or db.ensure_day_row(DB_PATH, user_id, local_date, start_date)
+    sent = state["sent"]
 
-    if due_by_now(local_now, user["morning_time"]):
-        await send_morning(bot, user, local_date)
+    # Everything is compared in minutes since local midnight.
+    now_minutes = local_now.hour * 60 + local_now.minute
+    evening_minutes = _hhmm_minutes(user["evening_time"])
 
-    if due_by_now(local_now, "12:00"):
-        await send_presence(bot, user, local_date)
+    if now_minutes >= _hhmm_minutes(user["morning_time"]):
+        await send_morning(bot, user, local_date, today_row, state["yesterday"], sent)
 
-    if due_by_now(local_now, user["evening_time"]):
-        await send_evening_prompt(bot, user, local_date)
+    # Presence lines only go out on every fourth day.
+    day_number = int(today_row.get("day_number") or 0)
+    if now_minutes >= 12 * 60 and day_number % 4 == 0 and 0 < day_number <= 44:
+        await send_presence(bot, user, local_date, today_row, sent)
 
-    eh, em = parse_hhmm(user["evening_time"])
-    reminder_time = (datetime.combine(local_date, time(eh, em)) + timedelta(minutes=30)).time()
-    if local_now.time().replace(second=0, microsecond=0) >= reminder_time:
-        await send_evening_reminder(bot, user, local_date)
+    if now_minutes >= evening_minutes:
+        await send_evening_prompt(bot, user, local_date, sent)
 
-    await send_final_summary(bot, user, local_date)
+    if now_minutes >= (evening_minutes + 30) % (24 * 60):
+        await send_evening_reminder(bot, user, local_date, today_row, sent)
 
+    if local_date == END_DATE:
+        await send_final_summary(bot, user, local_date, sent)
 
-async def loop_worker() -> None:
-    token = os.getenv("BOT_TOKEN")
-    if not token:
-        raise RuntimeError("BOT_TOKEN is required")
 
-    db.init_db(DB_PATH)
-    bot = Bot(token=token)
+def _tick_local_nows(users: list[dict], now_utc: datetime) -> dict[str, datetime]:
+    # One conversion per distinct timezone; unknown zones are left to
+    # process_user, which fails just that user.
+    local_nows = {}
+    for tz_name in {user["timezone"] for user in users}:
+        try:
+            local_nows[tz_name] = now_utc.astimezone(_zi(tz_name))
+        except Exception:
+            continue
+    return local_nows
 
-    while True:
-        await run_tick_once(bot=bot)
-        await asyncio.sleep(POLL_SECONDS)
 
+def _tick_local_dates(users: list[dict], local_nows: dict[str, datetime]) -> dict[int, date]:
+    # Local dates of the users a tick may send to.
+    return {
+        user["user_id"]: local_nows[user["timezone"]].date()
+        for user in users
+        if int(user["paused"]) != 1 and user["timezone"] in local_nows
+    }
+
+
+def next_due_utc(user: dict, now_utc: datetime) -> datetime | None:
+    """The next minute a tick could send this user something."""
+    if int(user["paused"]) == 1:
+        return None
+    try:
+        tz = _zi(user["timezone"])
+        evening = _hhmm_minutes(user["evening_time"])
+        # Local midnight starts a new day: queued time changes apply and the
+        # final summary goes out on the last one.
+        minutes = {0, _hhmm_minutes(user["morning_time"]), 12 * 60, evening, (evening + 30) % (24 * 60)}
+    except Exception:
+        return None
+    local_now = now_utc.astimezone(tz)
+    candidates = [
+        datetime.combine(local_now.date() + timedelta(days=offset), time(m // 60, m % 60), tzinfo=tz)
+        for offset in (0, 1)
+        for m in minutes
+    ]
+    return min(dt for dt in candidates if dt > local_now).astimezone(timezone.utc)
+
+
+def seconds_until_next_due(users: list[dict]) -> float:
+    # Capped so that users who onboard, resume or fail a send are picked up
+    # without a wake-up of their own.
+    now_utc = datetime.now(timezone.utc)
+    dues = [due for due in (next_due_utc(user, now_utc) for user in users) if due is not None]
+    ceiling = max(POLL_SECONDS, 1)
+    if not dues:
+        return ceiling
+    return min(max((min(dues) - now_utc).total_seconds(), 1), ceiling)
+
+
+_DB_READY = False
+
+
+def _ensure_db() -> None:
+    # The schema only needs creating once per process, not on every tick.
+    global _DB_READY
+    if not _DB_READY:
+        db.init_db(DB_PATH)
+        _DB_READY = True
+
+
+def build_bot(token: str, concurrency: int = TICK_CONCURRENCY) -> Bot:
+    # A bare Bot keeps a single HTTP/1.1 connection, which would make
+    # concurrent users queue for it. Over HTTP/2 the tick's sends share
+    # streams on one connection; the pool covers the HTTP/1.1 fallback.
+    request = HTTPXRequest(connection_pool_size=max(concurrency, 1), pool_timeout=5.0, http_version="2")
+    return Bot(token=token, request=request)
+
+
+# user_id -> (schedule fields, next due minute) as of the last clean run. Per
+# process: a fresh instance processes everyone once.
+_NEXT_DUE: dict[int, tuple[tuple, datetime]] = {}
+_NEVER = datetime.max.replace(tzinfo=timezone.utc)
 
-async def run_tick_once(bot: Bot | None = None) -> dict:
-    token = os.getenv("BOT_TOKEN")
-    if not token:
+
+def _schedule_key(user: dict) -> tuple:
+    # Anything the bot can change that moves a user's next send.
+    return tuple(
+        user.get(k) for k in ("paused", "timezone", "morning_time", "evening_time", "start_date", "pending_changes")
+    )
+
+
+def _remember_next_due(user: dict, now_utc: datetime) -> None:
+    # Taken from the tick's own clock reading: a later one could skip past a
+    # slot that came due while the user was being processed.
+    # Paused users have nothing due until the pause flag in the key changes.
+    due = next_due_utc(user, now_utc) or _NEVER
+    _NEXT_DUE[user["user_id"]] = (_schedule_key(user), due)
+
+
+def _is_due(user: dict, now_utc: datetime) -> bool:
+    known = _NEXT_DUE.get(user["user_id"])
+    return known is None or known[0] != _schedule_key(user) or known[1] <= now_utc
+
+
+def _require_token() -> str:
+    if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN is required")
+    return BOT_TOKEN
+
 
-    db.init_db(DB_PATH)
-    local_bot = bot or Bot(token=token)
+async def loop_worker() -> None:
+    token = _require_token()
+    _ensure_db()
+    async with build_bot(token) as bot:
+        while True:
+            # The sleep comes from the users the tick already loaded rather
+            # than a second scheduler query.
+            _, users = await _run_tick(bot, TICK_CONCURRENCY)
+            await asyncio.sleep(seconds_until_next_due(users))
+
+
+async def run_tick_once(bot: Bot | None = None, concurrency: int = TICK_CONCURRENCY) -> dict:
+    _ensure_db()
+    if bot is not None:
+        result, _ = await _run_tick(bot, concurrency)
+        return result
+    # Long-lived callers pass their own bot so its connections are reused
+    # across ticks; one made for a single tick is shut down with it.
+    async with build_bot(_require_token(), concurrency) as local_bot:
+        result, _ = await _run_tick(local_bot, concurrency)
+        return result
+
+
+async def _run_tick(local_bot: Bot, concurrency: int) -> tuple[dict, list[dict]]:
+    """Runs one tick; also returns the scheduler users it loaded."""
+    sem = asyncio.Semaphore(max(concurrency, 1))
     users_total = 0
-    users_ok = 0
     user_errors: list[dict] = []
-    try:
-        users = db.list_active_users(DB_PATH)
-        users_total = len(users)
-        for user in users:
+
+    async def process_one(
+        user: dict, state: dict | None, local_now: datetime | None, now_utc: datetime
+    ) -> bool:
+        async with sem:
             try:
-                await process_user(local_bot, user)
-                users_ok += 1
+                await process_user(local_bot, user, state, local_now)
+                _remember_next_due(user, now_utc)
+                return True
             except Exception:
+                _NEXT_DUE.pop(user.get("user_id"), None)
                 LOGGER.exception("user loop failed: %s", user.get("user_id"))
                 user_errors.append(
                     {
@@ -251,17 +443,38 @@ async def run_tick_once(bot: Bot | None = None) -> dict:
                         "error": "user_loop_failed",
                     }
                 )
+                return False
+
+    try:
+        users = db.list_scheduler_users(DB_PATH)
+        users_total = len(users)
+        now_utc = datetime.now(timezone.utc)
+        due = [user for user in users if _is_due(user, now_utc)]
+        local_nows = _tick_local_nows(due, now_utc)
+        states = db.load_tick_state(DB_PATH, _tick_local_dates(due, local_nows))
+        results = await asyncio.gather(
+            *(
+                process_one(user, states.get(user["user_id"]), local_nows.get(user["timezone"]), now_utc)
+                for user in due
+            )
+        )
     except Exception:
         LOGGER.exception("worker loop failed")
         raise
 
-    return {
+    result = {
         "users_total": users_total,
-        "users_ok": users_ok,
+        "users_ok": sum(results),
         "users_failed": len(user_errors),
+        "users_skipped": users_total - len(results),
         "errors": user_errors[:20],
     }
+    return result, users
 
 
 if __name__ == "__main__":
-    asyncio.run(loop_worker())
+    if uvloop is None:
+        asyncio.run(loop_worker())
+    else:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(loop_worker())